@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
-from git import Repo
+import errno
 from django.conf import settings
 from django.utils.version import get_version
 default_app_config = 'bigbuild.apps.BigbuildConfig'
@@ -62,15 +62,86 @@ def get_archive_directory():
     return path
 
 
+def get_cache_directory():
+    """
+    Returns the BIGBUILD_CACHE_DIR where bigbuild keeps its caches between runs.
+    """
+    # Return the BIGBUILD_CACHE_DIR settings, if it's been set, or fall back to the default.
+    path = getattr(
+        settings,
+        'BIGBUILD_CACHE_DIR',
+        os.path.join(settings.BASE_DIR, '.bigbuild-cache')
+    )
+    # Make the directory if it doesn't exist already
+    if not os.path.exists(path):
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            # Another process beat us to it
+            if e.errno != errno.EEXIST:
+                raise
+    # Return the path
+    return path
+
+
+# The branch last read from each repository, keyed by the path to its HEAD file
+_branch_cache = {}
+
+
+def get_git_head_path(repo_path):
+    """
+    Returns the path to the HEAD file of the git repository at the provided path.
+    """
+    git_dir = os.path.join(repo_path, '.git')
+    # Worktrees and submodules have a .git file pointing to the real directory
+    if os.path.isfile(git_dir):
+        with open(git_dir, 'r') as f:
+            contents = f.read().strip()
+        if contents.startswith('gitdir:'):
+            git_dir = os.path.join(repo_path, contents[len('gitdir:'):].strip())
+    # Bare repositories keep HEAD at the top
+    elif not os.path.isdir(git_dir):
+        git_dir = repo_path
+    return os.path.join(git_dir, 'HEAD')
+
+
 def get_repo_branch():
     """
     Returns the name of the current git branch.
+
+    The branch is read straight from the repository's HEAD file and remembered until that file changes.
+    GitPython is only called on when HEAD doesn't point to a branch.
     """
     if getattr(settings, 'BIGBUILD_GIT_BRANCH', None):
         return settings.BIGBUILD_GIT_BRANCH
     repo_path = getattr(settings, 'BIGBUILD_GIT_DIR', settings.BASE_DIR)
-    branch = Repo(repo_path).active_branch
-    return branch.name
+    head_path = get_git_head_path(repo_path)
+
+    # Check if HEAD has changed since we last looked
+    try:
+        st = os.stat(head_path)
+        signature = (st.st_ino, st.st_size, st.st_mtime)
+    except OSError:
+        signature = None
+    if signature:
+        try:
+            cached_signature, branch = _branch_cache[head_path]
+            if cached_signature == signature:
+                return branch
+        except KeyError:
+            pass
+
+        # If it has, read it again
+        with open(head_path, 'r') as f:
+            head = f.read().strip()
+        if head.startswith('ref: refs/heads/'):
+            branch = head[len('ref: refs/heads/'):]
+            _branch_cache[head_path] = (signature, branch)
+            return branch
+
+    # If HEAD can't be read or is detached, let GitPython sort it out
+    from git import Repo
+    return Repo(repo_path).active_branch.name
 
 
 def get_base_url():
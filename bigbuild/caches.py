@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Utilities for detecting changes to page files and caching work between runs.
+"""
+import os
+import time
+import bigbuild
+import hashlib
+import logging
+import tempfile
+from collections import OrderedDict
+from six.moves import cPickle as pickle
+logger = logging.getLogger(__name__)
+
+
+def walk_files(root, include_directories=False):
+    """
+    Returns the path to every file under the provided root, in the same order every time.
+
+    A root that is a single file comes back on its own, and one that does not exist comes back empty.
+    If include_directories is True, each directory is listed ahead of the files in it.
+    """
+    if os.path.isfile(root):
+        return [root]
+    path_list = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        # Sort everything so the walk is the same every time
+        dirnames.sort()
+        if include_directories:
+            path_list.append(dirpath)
+        path_list.extend(os.path.join(dirpath, f) for f in sorted(filenames))
+    return path_list
+
+
+def get_fingerprint(*paths):
+    """
+    Returns a hash of the name, size and modification time of every file and directory under the provided paths.
+
+    Any change to the files, including additions and deletions, returns a new value. Paths that do not exist are ignored.
+    """
+    h = hashlib.sha1()
+    for root in paths:
+        for p in walk_files(root, include_directories=True):
+            try:
+                st = os.stat(p)
+            except OSError:
+                # The file was removed during the walk
+                continue
+            h.update("{}:{}:{!r}\n".format(p, st.st_size, st.st_mtime).encode("utf-8"))
+    return h.hexdigest()
+
+
+def get_file_hash(path):
+    """
+    Returns a hash of the contents of the file at the provided path.
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def get_content_fingerprint(paths, root):
+    """
+    Returns a hash of the contents of every file under the provided paths.
+
+    File names are hashed relative to the root directory, so the value survives moving the files elsewhere.
+    Paths that do not exist are ignored.
+    """
+    h = hashlib.sha1()
+    for path in paths:
+        for p in walk_files(path):
+            h.update("{}\n".format(os.path.relpath(p, root)).encode("utf-8"))
+            try:
+                with open(p, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        h.update(chunk)
+            except (IOError, OSError):
+                # The file was removed during the walk
+                continue
+    return h.hexdigest()
+
+
+class LRUCache(object):
+    """
+    An in-memory mapping that drops the least recently used entries once their sizes add up to more than a budget.
+
+    It doesn't lock anything itself, so callers shared between threads need to hold a lock around it.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """
+        Empties the cache.
+        """
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored with the provided key, or the default if there isn't one.
+        """
+        try:
+            value, size = self.entries.pop(key)
+        except KeyError:
+            return default
+        # Move it to the back of the line
+        self.entries[key] = (value, size)
+        return value
+
+    def set(self, key, value, max_size, size=1):
+        """
+        Stores the provided value with the provided key, counting it as the provided size against the budget.
+
+        Values bigger than the whole budget aren't stored at all.
+        """
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        if size > max_size:
+            return
+        self.entries[key] = (value, size)
+        self.size += size
+        # Throw out the oldest entries until we're back under budget
+        while self.size > max_size:
+            old_key, (old_value, old_size) = self.entries.popitem(last=False)
+            logger.debug("Evicting {} from the cache".format(old_key))
+            self.size -= old_size
+
+
+def make_key(*parts):
+    """
+    Returns a cache key hashed from the provided values.
+    """
+    h = hashlib.sha1()
+    for part in parts:
+        h.update("{}\n".format(part).encode("utf-8"))
+    return h.hexdigest()
+
+
+class FileCache(object):
+    """
+    A cache of pickled Python objects stored in a subdirectory of the BIGBUILD_CACHE_DIR.
+
+    Entries are written to a temporary file and then renamed into place,
+    so a build running at the same time never reads one half-written.
+    Reading an entry touches its modification time, so prune can clear out the ones that haven't been used lately.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def directory(self):
+        """
+        Returns the directory where this cache's entries are stored.
+        """
+        return os.path.join(bigbuild.get_cache_directory(), self.name)
+
+    def get_path(self, key):
+        """
+        Returns the file path where the entry with the provided key is stored.
+        """
+        # Spread the entries across subdirectories so no one directory gets too big
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key, default=None):
+        """
+        Returns the entry stored with the provided key, or the default if there isn't one.
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path, None)
+            return value
+        except (IOError, OSError):
+            return default
+        except Exception as e:
+            # Entries that can't be unpickled, perhaps from an older version of the code, are treated as misses
+            logger.debug("Could not read {} cache entry {}: {}".format(self.name, key, e))
+            return default
+
+    def set(self, key, value):
+        """
+        Stores the provided value with the provided key.
+        """
+        path = self.get_path(key)
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # Another process beat us to it
+                pass
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            # Swap it into place in one move
+            getattr(os, 'replace', os.rename)(tmp_path, path)
+        except Exception:
+            os.path.exists(tmp_path) and os.remove(tmp_path)
+            raise
+
+    def delete(self, key):
+        """
+        Removes the entry with the provided key, if it exists.
+        """
+        try:
+            os.remove(self.get_path(key))
+        except OSError:
+            pass
+
+    def prune(self, max_age=None):
+        """
+        Removes entries that haven't been used in more than the provided number of seconds, or all of them if it's None.
+
+        Returns the number of entries removed.
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+        cutoff = None if max_age is None else time.time() - max_age
+        removed = 0
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for f in filenames:
+                # Leave alone any entries being written right now
+                if cutoff is None and f.startswith('.tmp-'):
+                    continue
+                path = os.path.join(dirpath, f)
+                try:
+                    if cutoff is None or os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    # Another process got to it first
+                    continue
+        logger.debug("Pruned {} entries from the {} cache".format(removed, self.name))
+        return removed
@@ -4,14 +4,92 @@
 Slimmed down subclasses of django-compressor internals that aim to work
 without django.contrib.staticfiles installed.
 """
+import os
+import six
 import codecs
+import hashlib
+import bigbuild
 from django.conf import settings
 from bigbuild import get_base_url
 from compressor.base import Compressor
 from compressor.js import JsCompressor
 from compressor.css import CssCompressor
-from django.template import Template, Context
+from collections import OrderedDict
+from compressor.utils import get_class
+from bigbuild.manifests import CompressManifest
+from django.template import Engine, Context
+from django.template.context import make_context
+from django.template.loader_tags import IncludeNode
+from django.utils.module_loading import import_string
+from bigbuild.rendering import template_cache
+from bigbuild.caches import FileCache, get_file_hash, make_key
 from compressor.exceptions import UncompressableFileError
+from compressor.offline.django import DjangoParser
+from compressor.cache import cache, get_templatetag_cachekey
+
+# Filters whose output depends only on their input, so it can be cached on disk
+CACHEABLE_FILTERS = (
+    'compressor.filters.cssmin.CSSCompressorFilter',
+    'compressor.filters.cssmin.rCSSMinFilter',
+    'compressor.filters.jsmin.rJSMinFilter',
+    'compressor.filters.jsmin.SlimItFilter',
+)
+
+# The types of context values we can safely key the rendered asset cache on
+CACHEABLE_TYPES = six.string_types + six.integer_types + (float, bool, type(None))
+
+
+class ContextRecorder(object):
+    """
+    Wraps a template context and remembers which names are looked up in it while rendering.
+
+    If a template reaches for the whole context at once, or writes to it, exhausted is set to True.
+    """
+    def __init__(self, context):
+        self.context = context
+        self.used = set()
+        self.exhausted = False
+
+    def __contains__(self, key):
+        self.used.add(key)
+        return key in self.context
+
+    def __getitem__(self, key):
+        self.used.add(key)
+        return self.context[key]
+
+    def __setitem__(self, key, value):
+        self.exhausted = True
+        self.context[key] = value
+
+    def get(self, key, otherwise=None):
+        self.used.add(key)
+        return self.context.get(key, otherwise)
+
+    def keys(self):
+        self.exhausted = True
+        if hasattr(self.context, 'flatten'):
+            return self.context.flatten().keys()
+        return self.context.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
+def get_included_templates(context):
+    """
+    Returns the paths to the template files pulled in with {% include %} while the provided context was rendered.
+    """
+    path_list = set()
+    # Include tags keep the templates they load at the bottom of the render context, keyed by the tag
+    for node, templates in context.render_context.dicts[0].items():
+        if not isinstance(node, IncludeNode):
+            continue
+        for template in templates.values():
+            name = getattr(getattr(template, 'origin', None), 'name', None)
+            if name and os.path.isfile(name):
+                path_list.add(name)
+    return sorted(path_list)
 
 
 class SimpleCompressor(Compressor):
@@ -63,27 +141,154 @@ class SimpleCompressor(Compressor):
     ):
         """
         An expansion of the standard method that will halt precompilation
-        when compression is off.
+        when compression is off, and reuse saved output when the same code
+        has been compiled before.
         """
         # If compression is off, skip it
         if not kind or not settings.COMPRESS_ENABLED:
             return False, content
 
-        # Clear out the filename settings so the compilers will use
-        # the rendered in-memory string and a temporary file instead.
+        # Precompilers that take the rendered content as it is get the real filename, so they know which page
+        # the code belongs to. The rest have the filename cleared out so they will use the rendered
+        # in-memory string and a temporary file instead.
         kwargs.pop("basename", "")
+        precompiler = self.get_precompiler(content, elem, filename, charset)
         filename = None
 
-        # Otherwise compile away as usual
-        return super(SimpleCompressor, self).precompile(
+        # Check if we've compiled this code before
+        cache_key = self.get_precompile_key(content, elem, charset, precompiler)
+        if cache_key:
+            cached = self.compiled_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        # Otherwise compile away
+        if precompiler:
+            result = True, precompiler.input(**kwargs)
+        else:
+            result = super(SimpleCompressor, self).precompile(
+                content,
+                kind,
+                elem,
+                filename,
+                charset,
+                **kwargs
+            )
+        if cache_key:
+            self.compiled_cache.set(cache_key, result)
+        return result
+
+    def get_precompiler(self, content, elem, filename, charset):
+        """
+        Returns the precompiler for the provided code if it's a class with compiles_content set to True,
+        or None if the standard method should handle it.
+
+        It's given the code's filename, or the page's index.html for code written right into the page.
+        """
+        attrs = self.parser.elem_attribs(elem)
+        filter_or_command = self.precompiler_mimetypes.get(attrs.get("type", None))
+        if filter_or_command is None:
+            return None
+        try:
+            precompiler_class = import_string(filter_or_command)
+        except ImportError:
+            return None
+        if not getattr(precompiler_class, 'compiles_content', False):
+            return None
+        return precompiler_class(
             content,
-            kind,
-            elem,
-            filename,
+            attrs=attrs,
+            filter_type=self.type,
+            charset=charset,
+            filename=filename or self.get_page_filename()
+        )
+
+    def get_page_filename(self):
+        """
+        Returns the path to the index.html of the page being rendered, or None if there isn't one.
+        """
+        obj = self.context.get('object', None)
+        page_directory_path = getattr(obj, 'page_directory_path', None)
+        if page_directory_path:
+            return os.path.join(page_directory_path, 'index.html')
+        return None
+
+    # Precompiled and filtered code, keyed by its contents and what was done to it
+    compiled_cache = FileCache('compiled')
+
+    def get_precompile_key(self, content, elem, charset, precompiler=None):
+        """
+        Returns the compiled cache key for the provided code, or None if its precompiler can't be cached.
+
+        Precompilers that are bigbuild classes are cached if they have a get_cache_key_parts method,
+        which returns what goes into their output other than the code, like the files it can import.
+        Shell commands are cached if their mimetype is in the COMPRESS_CACHEABLE_PRECOMPILERS setting.
+        Set BIGBUILD_COMPRESS_CACHE to False to turn the cache off.
+        """
+        if not getattr(settings, 'BIGBUILD_COMPRESS_CACHE', True):
+            return None
+        mimetype = self.parser.elem_attribs(elem).get("type", None)
+        filter_or_command = self.precompiler_mimetypes.get(mimetype)
+        if filter_or_command is None:
+            return None
+
+        if precompiler is not None:
+            if not hasattr(precompiler, 'get_cache_key_parts'):
+                return None
+            parts = precompiler.get_cache_key_parts()
+        else:
+            try:
+                precompiler_class = import_string(filter_or_command)
+            except ImportError:
+                # It's a shell command
+                if mimetype not in settings.COMPRESS_CACHEABLE_PRECOMPILERS:
+                    return None
+                parts = ()
+            else:
+                if not hasattr(precompiler_class, 'get_cache_key_parts'):
+                    return None
+                parts = precompiler_class(content, filter_type=self.type, charset=charset).get_cache_key_parts()
+
+        return make_key(
+            'precompile',
+            bigbuild.__version__,
+            hashlib.sha1(content.encode('utf-8')).hexdigest(),
+            mimetype,
+            filter_or_command,
             charset,
-            **kwargs
+            *parts
         )
 
+    def filter(self, content, filters, method, **kwargs):
+        """
+        An expansion of the standard method that saves the output of filter chains made up only of
+        CACHEABLE_FILTERS, so unchanged code isn't minified again.
+        """
+        cacheable = [get_class(f) for f in CACHEABLE_FILTERS]
+        if (
+            not filters or
+            not getattr(settings, 'BIGBUILD_COMPRESS_CACHE', True) or
+            any(f not in cacheable for f in filters)
+        ):
+            return super(SimpleCompressor, self).filter(content, filters, method, **kwargs)
+
+        cache_key = make_key(
+            'filter',
+            bigbuild.__version__,
+            hashlib.sha1(content.encode('utf-8')).hexdigest(),
+            self.type,
+            method,
+            *["{}.{}".format(f.__module__, f.__name__) for f in filters]
+        )
+        output = self.compiled_cache.get(cache_key)
+        if output is None:
+            output = super(SimpleCompressor, self).filter(content, filters, method, **kwargs)
+            self.compiled_cache.set(cache_key, output)
+        return output
+
+    # Rendered static files, keyed by their contents and the context values they used
+    asset_cache = FileCache('assets')
+
     def get_filecontent(self, filename, charset):
         """
         A custom override that renders file content as a Django template
@@ -91,20 +296,263 @@ class SimpleCompressor(Compressor):
 
         This allows for metadata from the page object to be included in
         static files.
+
+        Files without any template tags are passed through untouched. The rest are saved to a cache keyed by
+        their contents, the context values they looked up and the contents of any templates they include,
+        so unchanged files rendered with the same values aren't rendered again, on this page, on another page
+        or in the next build.
         """
         if charset == 'utf-8':
             # Removes BOM
             charset = 'utf-8-sig'
         with codecs.open(filename, 'r', charset) as fd:
-            # All the custom bits are right here
             content = fd.read()
-            template = Template(content)
-            context = Context(self.context)
-            rendered_content = template.render(context)
-            return rendered_content
+
+        # If there's nothing to render, don't bother
+        if '{{' not in content and '{%' not in content and '{#' not in content:
+            return content
+
+        # Check if we've rendered it with these values and included templates before
+        content_hash = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        inputs_key = make_key('inputs', bigbuild.__version__, content_hash)
+        inputs = self.asset_cache.get(inputs_key)
+        if inputs is not None:
+            output_key = self.get_output_key(content_hash, inputs['names'], inputs['templates'])
+            rendered_content = output_key and self.asset_cache.get(output_key)
+            if rendered_content is not None:
+                return rendered_content
+
+        # All the custom bits are right here
+        template = template_cache.from_string(Engine.get_default(), content)
+        recorder = ContextRecorder(self.context)
+        context = Context(recorder)
+        rendered_content = template.render(context)
+
+        # Save it for next time, if it only depended on values we can key the cache on
+        if not recorder.exhausted:
+            inputs = dict(names=sorted(recorder.used), templates=get_included_templates(context))
+            output_key = self.get_output_key(content_hash, inputs['names'], inputs['templates'])
+            if output_key:
+                self.asset_cache.set(inputs_key, inputs)
+                self.asset_cache.set(output_key, rendered_content)
+        return rendered_content
+
+    def get_output_key(self, content_hash, names, templates=()):
+        """
+        Returns the asset cache key for a file with the provided hash rendered with the current values of the
+        provided context names and the current contents of the provided included templates.
+
+        Returns None if any of the values are something other than a string, number, boolean or None.
+        """
+        missing = object()
+        parts = []
+        for path in templates:
+            try:
+                parts.append("{}:{}".format(path, get_file_hash(path)))
+            except (IOError, OSError):
+                parts.append("{} is missing".format(path))
+        for name in names:
+            value = self.context.get(name, missing)
+            if value is missing:
+                parts.append("{} is missing".format(name))
+            elif isinstance(value, CACHEABLE_TYPES):
+                parts.append("{}={!r}".format(name, value))
+            else:
+                return None
+        return make_key('output', bigbuild.__version__, content_hash, *parts)
+
+
+# Bundles compressed ahead of time by the compresspages command, keyed by get_bundle_key
+_offline_bundles = None
+
+# The BundleCollector looking for bundles while compresspages renders the pages, if there is one
+_bundle_collector = None
+
+
+def get_bundle_key(kind, mode, content):
+    """
+    Returns the key for the compress block with the provided kind, mode and rendered content.
+    """
+    return make_key('bundle', bigbuild.__version__, kind, mode, content)
+
+
+def get_context_snapshot(context, names):
+    """
+    Returns a dictionary of how the provided names look in the provided context,
+    to check if a bundle compressed with one context would come out the same with another.
+    """
+    missing = object()
+    snapshot = {}
+    for name in names:
+        value = context.get(name, missing)
+        if value is missing:
+            snapshot[name] = None
+        elif isinstance(value, CACHEABLE_TYPES):
+            snapshot[name] = repr(value)
+        else:
+            # Anything else can't be compared, so it never matches
+            snapshot[name] = '<{}>'.format(type(value).__name__)
+    return snapshot
+
+
+def set_offline_bundles(bundles):
+    """
+    Sets the bundles the compressors hand back instead of compressing them again. Pass None to stop.
+    """
+    global _offline_bundles
+    _offline_bundles = bundles
+
+
+def get_offline_bundles():
+    """
+    Returns the bundles compressed ahead of time, or None if there aren't any.
+
+    They're set by the build command's --compress option, or read from the last run of compresspages
+    if the BIGBUILD_COMPRESS_OFFLINE setting is True.
+    """
+    global _offline_bundles
+    if _offline_bundles is None and getattr(settings, 'BIGBUILD_COMPRESS_OFFLINE', False):
+        _offline_bundles = CompressManifest().read()
+    return _offline_bundles
+
+
+class RecordingContext(dict):
+    """
+    A context dictionary that remembers which names are looked up in it.
+    """
+    def __init__(self, *args, **kwargs):
+        super(RecordingContext, self).__init__(*args, **kwargs)
+        self.used = set()
+
+    def __contains__(self, key):
+        self.used.add(key)
+        return super(RecordingContext, self).__contains__(key)
+
+    def __getitem__(self, key):
+        self.used.add(key)
+        return super(RecordingContext, self).__getitem__(key)
+
+    def get(self, key, default=None):
+        self.used.add(key)
+        return super(RecordingContext, self).get(key, default)
+
+
+class BundleCollector(object):
+    """
+    Gathers up the bundles in compress blocks as their templates are rendered, rather than compressing them.
+
+    It's used as a context manager. While it's open, compressors report to it and return nothing.
+    """
+    def __init__(self):
+        self.jobs = OrderedDict()
+        self.cache_keys = set()
+
+    def __enter__(self):
+        global _bundle_collector
+        _bundle_collector = self
+        return self
+
+    def __exit__(self, *args):
+        global _bundle_collector
+        _bundle_collector = None
+        # The compress tag caches the empty output we handed it, so clear that out before the real render
+        for key in self.cache_keys:
+            cache.delete(key)
+
+    def add(self, compressor, mode):
+        """
+        Records the bundle for the provided compressor, if it hasn't been seen already.
+        """
+        self.cache_keys.add(get_templatetag_cachekey(compressor, mode, compressor.type))
+        key = get_bundle_key(compressor.type, mode, compressor.content)
+        if key in self.jobs:
+            return
+
+        # Only pass along the values that can be sent to another process and compared afterwards
+        context = compressor.context
+        if hasattr(context, 'flatten'):
+            context = context.flatten()
+        context = dict(
+            (k, v) for k, v in context.items() if k != 'compressed' and isinstance(v, CACHEABLE_TYPES)
+        )
+        compressor_class = "{}.{}".format(compressor.__class__.__module__, compressor.__class__.__name__)
+        self.jobs[key] = (key, compressor_class, mode, compressor.content, context)
+
+
+def compress_bundle(job):
+    """
+    Compresses a bundle found by a BundleCollector and returns its key and manifest entry.
+
+    Accepts a single tuple so it can be mapped across a pool of processes. The entry records the output along with
+    the context values it was made from, so pages with different values can tell it doesn't apply to them.
+    """
+    key, compressor_class, mode, content, context = job
+    context = RecordingContext(context)
+    output = get_class(compressor_class)(content=content, context=context).compress(mode)
+    names = context.used - set(['compressed'])
+    return key, dict(output=output, context=get_context_snapshot(context, sorted(names)))
+
+
+def collect_bundles(template, context=None, request=None):
+    """
+    Renders only the compress blocks in the provided template, so an open BundleCollector can record their bundles.
+
+    They're found in the template source the same way django-compressor's offline parser does it, with the rest
+    of the page left alone. Blocks inside included templates or the page's content aren't found, and are compressed
+    when the page renders instead.
+    """
+    parser = DjangoParser(charset=settings.FILE_CHARSET)
+    context = make_context(context, request, autoescape=template.engine.autoescape)
+    with context.render_context.push_state(template), context.bind_template(template):
+        for node in parser.walk_nodes(template, context=context):
+            node.render(context)
+
+
+class OfflineMixin(object):
+    """
+    Lets a compressor hand back bundles compressed ahead of time by the compresspages command.
+
+    While compresspages is looking through the pages, bundles are passed to its BundleCollector instead.
+    """
+    # Set on the compressors a bundle is split into, which are compressed as part of it
+    is_subnode = False
+
+    def split_contents(self):
+        split_content = super(OfflineMixin, self).split_contents()
+        for extra, node in getattr(self, 'extra_nodes', []) + getattr(self, 'media_nodes', []):
+            node.is_subnode = True
+        return split_content
+
+    def output(self, mode='file', forced=False):
+        """
+        An expansion of the standard method that reads from the offline bundles when they have this one.
+        """
+        if forced or self.is_subnode:
+            return self.compress(mode, forced=forced)
+
+        # If compresspages is looking for bundles, give it this one
+        if _bundle_collector is not None:
+            _bundle_collector.add(self, mode)
+            return ''
+
+        # If it's been compressed already, and the values it used are the same here, hand that back
+        bundles = get_offline_bundles()
+        if bundles:
+            entry = bundles.get(get_bundle_key(self.type, mode, self.content))
+            if entry and entry['context'] == get_context_snapshot(self.context, entry['context'].keys()):
+                return entry['output']
+
+        # Otherwise compress it now
+        return self.compress(mode, forced=forced)
+
+    def compress(self, mode='file', forced=False):
+        """
+        Compresses the bundle and returns the output, without looking for it anywhere else.
+        """
+        return super(OfflineMixin, self).output(mode, forced=forced)
 
 
-class SimpleCssCompressor(CssCompressor, SimpleCompressor):
+class SimpleCssCompressor(OfflineMixin, CssCompressor, SimpleCompressor):
     """
     Our custom CSS compressor.
     """
@@ -119,7 +567,7 @@ class SimpleCssCompressor(CssCompressor, SimpleCompressor):
         super(CssCompressor, self).__init__(content, output_prefix, context, filters)
 
 
-class SimpleJsCompressor(JsCompressor, SimpleCompressor):
+class SimpleJsCompressor(OfflineMixin, JsCompressor, SimpleCompressor):
     """
     Our custom JavaScript compressor.
     """
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tools for loading the data files attached to pages.
+"""
+import os
+import csv
+import sys
+import six
+import json
+import yaml
+import array
+import codecs
+import archieml
+import logging
+import bigbuild
+import threading
+from functools import partial
+from six.moves import zip
+from collections import Mapping, Sequence
+from django.conf import settings
+from bigbuild.caches import FileCache, LRUCache, get_file_hash, make_key
+from django.core.serializers.base import DeserializationError
+logger = logging.getLogger(__name__)
+
+
+def load_csv(f):
+    return list(csv.DictReader(f))
+
+
+def load_json(f):
+    return json.load(f)
+
+
+def load_yaml(f):
+    return yaml.load(f)
+
+
+def load_aml(f):
+    return archieml.load(f)
+
+
+# The functions that parse each type of data file, keyed by file extension
+PARSERS = {
+    '.csv': load_csv,
+    '.json': load_json,
+    '.yml': load_yaml,
+    '.yaml': load_yaml,
+    '.aml': load_aml,
+}
+
+
+# The array typecodes and converters for the column types compact CSVs can declare
+COLUMN_TYPES = {
+    'int': ('q' if six.PY3 else 'l', int),
+    'float': ('d', float),
+}
+
+
+class CompactCSV(Sequence):
+    """
+    A CSV file stored as columns instead of as a list of dicts, which takes a fraction of the memory.
+
+    Rows are built into dicts as they are accessed, so templates can loop through it like any other CSV.
+    """
+    def __init__(self, fieldnames, columns):
+        self.fieldnames = fieldnames
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return dict(zip(self.fieldnames, [c[index] for c in self.columns]))
+
+    def __iter__(self):
+        for values in zip(*self.columns):
+            yield dict(zip(self.fieldnames, values))
+
+    def __repr__(self):
+        return "<CompactCSV: {} rows>".format(len(self))
+
+    def column(self, name):
+        """
+        Returns all of the values in the column with the provided name.
+        """
+        return self.columns[self.fieldnames.index(name)]
+
+
+def load_compact_csv(f, types=None):
+    """
+    Parses the provided CSV file into a CompactCSV.
+
+    Repeated values share one string, and the columns named in the types dictionary
+    are converted to "int" or "float" and packed into arrays. Typed columns with blank cells
+    are kept as lists, with the blanks set to None.
+
+    Raises a DeserializationError naming the file and column if a typed column is missing,
+    has a type we don't know or has a value that can't be converted.
+    """
+    reader = csv.reader(f)
+    try:
+        fieldnames = next(reader)
+    except StopIteration:
+        return CompactCSV([], [])
+
+    # Read it into columns, reusing the string for values we've seen before
+    columns = [[] for name in fieldnames]
+    seen = {}
+    for row in reader:
+        # Skip blank lines, like csv.DictReader
+        if not row:
+            continue
+        for i, column in enumerate(columns):
+            value = row[i] if i < len(row) else None
+            column.append(seen.setdefault(value, value))
+
+    # Convert any typed columns
+    filename = getattr(f, 'name', 'CSV file')
+    for name, type_name in (types or {}).items():
+        if name not in fieldnames:
+            raise DeserializationError("Column {} in {} could not be found".format(name, filename))
+        if type_name not in COLUMN_TYPES:
+            raise DeserializationError("Column {} in {} has type {}, which is not one of {}".format(
+                name, filename, type_name, ", ".join(sorted(COLUMN_TYPES))
+            ))
+        typecode, convert = COLUMN_TYPES[type_name]
+        i = fieldnames.index(name)
+        try:
+            values = [None if v in ('', None) else convert(v) for v in columns[i]]
+        except ValueError as e:
+            error = DeserializationError("Column {} in {} could not be converted to {}: {}".format(
+                name, filename, type_name, e
+            ))
+            six.reraise(DeserializationError, error, sys.exc_info()[2])
+        columns[i] = values if None in values else array.array(typecode, values)
+
+    return CompactCSV(fieldnames, columns)
+
+
+def get_data_options(value):
+    """
+    Returns the path and loading options for an entry in a page's data frontmatter.
+
+    An entry can be a path, or a dictionary with a path and options. CSV files can opt into
+    the CompactCSV format, with typed columns, like so:
+
+        data:
+          results:
+            path: results.csv
+            compact: true
+            types:
+              votes: int
+              percent: float
+    """
+    if isinstance(value, dict):
+        return value['path'], dict(
+            compact=bool(value.get('compact', False)),
+            types=value.get('types') or {}
+        )
+    return value, {}
+
+
+# json's C parser is about as quick as unpickling, so it isn't worth caching
+UNCACHED_PARSERS = [load_json]
+
+# Returned by the cache when there's no entry, since a data file could parse to None
+MISSING = object()
+
+
+def get_parser(path):
+    """
+    Returns the function that parses the data file at the provided path, or None if it's not a type we know.
+    """
+    return PARSERS.get(os.path.splitext(path)[1].lower())
+
+
+class DataLoader(object):
+    """
+    Parses data files and remembers the results, so a file shared by several pages is only parsed once per process.
+
+    Results are keyed by the file's absolute path, size and modification time, so edits are picked up right away.
+    The least recently used results are dropped once the files behind them add up to more than the
+    BIGBUILD_DATA_CACHE_SIZE setting, in bytes. It defaults to 100 megabytes. Set it to 0 to turn the cache off.
+
+    The same parsed objects are handed to every page that asks for the file, and to every later load
+    until the file changes. They are not copied, since that would cost as much as parsing them again,
+    so they must be treated as read only. Anything that needs to change them should work on a copy.
+    """
+    cache = FileCache('data')
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        """
+        Empties the cache and resets the counters.
+        """
+        with self.lock:
+            self.entries = LRUCache()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'BIGBUILD_DATA_CACHE_SIZE', 100 * 1024 * 1024)
+
+    def get_key(self, path):
+        """
+        Returns the cache key for the file at the provided path.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        return (path, st.st_size, st.st_mtime)
+
+    def load(self, path, compact=False, types=None):
+        """
+        Returns the parsed contents of the data file at the provided path.
+
+        CSV files are returned as a CompactCSV if compact is True, with the provided column types.
+        Raises a DeserializationError if it isn't a type of file we know how to parse.
+        """
+        parser = get_parser(path)
+        if not parser:
+            raise DeserializationError("Data file at {} not recognizable type".format(path))
+        if compact and parser == load_csv:
+            parser = partial(load_compact_csv, types=types)
+
+        key = self.get_key(path) + (compact, tuple(sorted((types or {}).items())))
+        with self.lock:
+            value = self.entries.get(key, MISSING)
+            if value is not MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        # Parse it outside the lock so other threads aren't held up
+        value = self.parse(path, parser, key[-2:])
+
+        with self.lock:
+            if key not in self.entries:
+                # Count each entry as the size of the file behind it
+                self.entries.set(key, value, self.max_size, size=key[1])
+        return value
+
+    def parse(self, path, parser, options):
+        """
+        Returns the data file at the provided path run through the provided parser.
+
+        YAML, ArchieML and CSV files are slow to parse in Python, so unless the BIGBUILD_DATA_CACHE setting
+        is False their results are saved to the BIGBUILD_CACHE_DIR, keyed by the file's contents and the
+        provided loading options, and read back from there next time the file is loaded.
+        """
+        use_cache = getattr(settings, 'BIGBUILD_DATA_CACHE', True) and parser not in UNCACHED_PARSERS
+        if use_cache:
+            key = make_key(bigbuild.__version__, get_file_hash(path), os.path.splitext(path)[1].lower(), *options)
+            value = self.cache.get(key, MISSING)
+            if value is not MISSING:
+                return value
+
+        with codecs.open(path, 'r') as f:
+            value = parser(f)
+
+        if use_cache:
+            self.cache.set(key, value)
+        return value
+
+
+# The loader shared by every page in this process
+data_loader = DataLoader()
+
+
+class LazyDataObjects(Mapping):
+    """
+    A mapping of a page's data files that only parses each one the first time it is looked up.
+
+    Files that can't be loaded raise a DeserializationError naming the file. The parsed data comes
+    from the shared DataLoader, so it may be handed to other pages as well and must not be modified.
+
+    Pages that are only loaded for their metadata, or templates that skip some of their data,
+    never pay to parse files they don't use.
+    """
+    def __init__(self, paths, options=None):
+        # The path to each data file, keyed by the name it goes by in templates
+        self.paths = paths
+        # Any options for loading them, keyed the same way
+        self.options = options or {}
+        # Whatever we have parsed so far
+        self.loaded = {}
+
+    def __getitem__(self, key):
+        try:
+            return self.loaded[key]
+        except KeyError:
+            pass
+        path = self.paths[key]
+        try:
+            value = data_loader.load(path, **self.options.get(key, {}))
+        except DeserializationError:
+            # These already say which file is to blame
+            raise
+        except Exception as e:
+            # Django's templates quietly swallow ValueErrors and the like when resolving variables,
+            # which would leave a page missing its data, so pass it on as something they won't.
+            error = DeserializationError("Could not load data file {} at {}: {}".format(key, path, e))
+            six.reraise(DeserializationError, error, sys.exc_info()[2])
+        self.loaded[key] = value
+        return value
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __repr__(self):
+        return "<LazyDataObjects: {}>".format(", ".join(sorted(self.paths)))
+
+    def __getstate__(self):
+        # Only the paths get pickled, so cached pages don't carry around parsed data
+        return dict(paths=self.paths, options=self.options, loaded={})
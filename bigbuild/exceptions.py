@@ -16,6 +16,29 @@ class BadMetadata(Exception):
         Exception.__init__(self, *args, **kwargs)
 
 
+class BuildError(Exception):
+    """
+    A custom exception to raise when one or more pages fail to build.
+
+    The failures attribute is a list of (slug, error message) pairs.
+    """
+    def __init__(self, failures):
+        self.failures = failures
+        message = "{} page(s) failed to build\n\n{}".format(
+            len(failures),
+            "\n\n".join("{}: {}".format(slug, error) for slug, error in failures)
+        )
+        Exception.__init__(self, message)
+
+
+class CompilerError(Exception):
+    """
+    A custom exception to raise when a compiler in a CompilerPool fails to compile a job.
+    """
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+
 class BaseWarning(Warning):
     """
     A base Warning class with elements we want to reuse across all of
@@ -37,7 +37,7 @@ class LatestPages(BuildableFeed):
         """
         Excludes pages that have their `show_in_feeds` attribute set to False.
         """
-        return [p for p in PageList() if p.show_in_feeds]
+        return [p for p in PageList.snapshot() if p.show_in_feeds]
 
     def item_title(self, obj):
         return obj.headline
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A reusable replacement for django-bakery's copytree_and_gzip that caches and pools the work.
+"""
+import os
+import six
+import gzip
+import hashlib
+import logging
+import mimetypes
+import threading
+import multiprocessing
+from fs import path
+from fs import copy
+from django.conf import settings
+from multiprocessing.pool import ThreadPool
+from django.utils.encoding import smart_text
+from bakery import DEFAULT_GZIP_CONTENT_TYPES
+from bigbuild.caches import FileCache, make_key
+logger = logging.getLogger(__name__)
+
+
+class Gzipper(object):
+    """
+    Copies directories into the build filesystem, gzipping the same files django-bakery would along the way.
+
+    Compressed files are cached by the hash of their contents, so unchanged files are never recompressed,
+    and each directory is processed across a pool of threads.
+
+    Configured with the following settings:
+
+        BIGBUILD_GZIP_LEVEL: The compression level from 1 to 9. Defaults to 9, like django-bakery.
+        BIGBUILD_GZIP_WORKERS: The number of threads. Defaults to the number of CPUs.
+            When the build is spread across several processes, the threads are split between them.
+        BIGBUILD_GZIP_CACHE: Whether to cache compressed files in the BIGBUILD_CACHE_DIR. Defaults to True.
+    """
+    cache = FileCache('gzip')
+
+    def __init__(self, fs, processes=1):
+        # The filesystem files are written to
+        self.fs = fs
+
+        # Configuration
+        self.level = getattr(settings, 'BIGBUILD_GZIP_LEVEL', 9)
+        # Split the threads between however many processes are building at once,
+        # so a pooled build doesn't start a full set in each one.
+        self.workers = max(1, getattr(settings, 'BIGBUILD_GZIP_WORKERS', multiprocessing.cpu_count()) // processes)
+        self.use_cache = getattr(settings, 'BIGBUILD_GZIP_CACHE', True)
+        self.content_types = getattr(settings, 'GZIP_CONTENT_TYPES', DEFAULT_GZIP_CONTENT_TYPES)
+
+        # Running totals
+        self.lock = threading.Lock()
+        self.file_count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def bytes_saved(self):
+        """
+        Returns the number of bytes gzipping has saved so far.
+        """
+        return self.bytes_in - self.bytes_out
+
+    def copytree_and_gzip(self, source_dir, target_dir):
+        """
+        Copies the provided source directory to the provided target directory.
+
+        Gzips JavaScript, CSS and HTML and other files along the way.
+        """
+        # Figure out what we're building and make the directories up front,
+        # so the threads don't trip over each other creating them.
+        build_list = []
+        for (dirpath, dirnames, filenames) in os.walk(source_dir):
+            rel_path = os.path.relpath(dirpath, source_dir)
+            target_subdir = path.normpath(path.join(smart_text(target_dir), smart_text(rel_path)))
+            self.fs.makedirs(target_subdir, recreate=True)
+            for f in filenames:
+                build_list.append((os.path.join(dirpath, f), path.join(target_subdir, smart_text(f))))
+
+        logger.debug("Gzipping {} files from {}".format(len(build_list), source_dir))
+        bytes_saved = self.bytes_saved
+
+        # Build em all
+        if self.workers > 1 and len(build_list) > 1:
+            pool = ThreadPool(processes=min(self.workers, len(build_list)))
+            try:
+                pool.map(self.pooled_copyfile_and_gzip, build_list)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            [self.copyfile_and_gzip(*u) for u in build_list]
+
+        logger.debug("Gzipping {} saved {} bytes".format(source_dir, self.bytes_saved - bytes_saved))
+
+    def pooled_copyfile_and_gzip(self, payload):
+        """
+        A passthrough for our ThreadPool because it can't take two arguments.
+        """
+        self.copyfile_and_gzip(*payload)
+
+    def copyfile_and_gzip(self, source_path, target_path):
+        """
+        Copies the provided file to the provided target path, gzipping it if it's a type we want to.
+        """
+        content_type, encoding = mimetypes.guess_type(source_path)
+
+        # If it isn't a file we want to gzip, or it's already gzipped, just copy it
+        if content_type not in self.content_types or encoding == 'gzip':
+            logger.debug("Copying {} to {}".format(source_path, target_path))
+            copy.copy_file("osfs:///", smart_text(source_path), self.fs, smart_text(target_path))
+            return
+
+        # Otherwise zip it up
+        logger.debug("Gzipping {} to {}".format(source_path, target_path))
+        with open(source_path, 'rb') as f:
+            data = f.read()
+        compressed = self.gzip(data, path.basename(target_path))
+        with self.fs.open(smart_text(target_path), 'wb') as outfile:
+            outfile.write(compressed)
+
+        # Keep score
+        with self.lock:
+            self.file_count += 1
+            self.bytes_in += len(data)
+            self.bytes_out += len(compressed)
+
+    def gzip(self, data, filename):
+        """
+        Returns the provided bytes gzipped, pulling them from the cache if they've been compressed before.
+
+        The filename is written into the gzip header, so it is part of the cache key.
+        """
+        key = make_key(hashlib.sha1(data).hexdigest(), filename, self.level)
+        if self.use_cache:
+            compressed = self.cache.get(key)
+            if compressed is not None:
+                return compressed
+
+        # Write GZIP data to an in-memory buffer.
+        # mtime is set to 0 so unchanged files always come out the same.
+        data_buffer = six.BytesIO()
+        with gzip.GzipFile(
+            filename=filename,
+            mode='wb',
+            fileobj=data_buffer,
+            compresslevel=self.level,
+            mtime=0
+        ) as f:
+            f.write(data)
+        compressed = data_buffer.getvalue()
+
+        if self.use_cache:
+            self.cache.set(key, compressed)
+        return compressed
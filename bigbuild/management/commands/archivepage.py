@@ -35,7 +35,7 @@ class Command(BaseCommand):
         for slug in options['slug']:
             # Pull the object
             try:
-                p = PageList()[slug]
+                p = PageList.get_page_by_slug(slug)
             except Exception:
                 raise CommandError("Slug provided (%s) does not exist" % slug)
 
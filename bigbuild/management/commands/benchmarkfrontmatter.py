@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import io
+import os
+import json
+import time
+import shutil
+import tempfile
+from datetime import datetime
+from greeking import latimes_ipsum
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+from bigbuild.serializers import FrontmatterParser, FastFrontmatterParser
+
+METADATA_TEMPLATE = u"""---
+headline: {headline}
+byline: {byline}
+description: {description}
+image_url: http://www.example.com/{slug}.jpg
+pub_date: {pub_date}
+published: true
+show_in_feeds: true
+data:
+  results: results.csv
+  candidates:
+    path: candidates.csv
+    compact: true
+extra:
+  tags: [politics, elections, {slug}]
+---
+{content}
+"""
+
+
+class Command(BaseCommand):
+    help = 'Compares how fast the frontmatter parsers read a synthetic set of metadata.md files'
+
+    def add_arguments(self, parser):
+        """
+        Custom arguments for this command
+        """
+        parser.add_argument(
+            '--count',
+            action='store',
+            dest='count',
+            type=int,
+            default=1000,
+            help='The number of metadata.md files to generate. Defaults to 1000.'
+        )
+        parser.add_argument(
+            '--parser',
+            action='append',
+            dest='parser_list',
+            default=[],
+            help='The dotted path to another parser to compare. Can be used more than once.'
+        )
+
+    def create_corpus(self, directory, count):
+        """
+        Writes the provided number of fake metadata.md files to the provided directory and returns their paths.
+        """
+        path_list = []
+        for i in range(count):
+            path = os.path.join(directory, '{}.md'.format(i))
+            story = latimes_ipsum.get_story()
+            with io.open(path, 'w', encoding='utf-8') as f:
+                f.write(METADATA_TEMPLATE.format(
+                    slug='page-{}'.format(i),
+                    # Quote the text as JSON, which YAML reads too, so punctuation can't trip it up
+                    headline=json.dumps(story.headline),
+                    byline=json.dumps(story.byline),
+                    description=json.dumps(story.description),
+                    pub_date=datetime(2017, 1, 1).isoformat(),
+                    content=story.content
+                ))
+            path_list.append(path)
+        return path_list
+
+    def time_parser(self, parser, path_list):
+        """
+        Returns the number of seconds the provided parser takes to read every file in the provided list.
+        """
+        start = time.time()
+        for path in path_list:
+            with open(path, 'r') as stream:
+                parser.load(stream)
+        return time.time() - start
+
+    def handle(self, *args, **options):
+        """
+        Make it happen.
+        """
+        parser_list = [FrontmatterParser, FastFrontmatterParser]
+        parser_list.extend(import_string(p) for p in options['parser_list'])
+
+        directory = tempfile.mkdtemp()
+        try:
+            path_list = self.create_corpus(directory, options['count'])
+            baseline = None
+            for parser_class in parser_list:
+                seconds = self.time_parser(parser_class(), path_list)
+                baseline = baseline or seconds
+                self.stdout.write('{}: {:.3f} seconds, {:.1f}x'.format(
+                    parser_class.__name__,
+                    seconds,
+                    baseline / seconds if seconds else 0
+                ))
+        finally:
+            shutil.rmtree(directory)
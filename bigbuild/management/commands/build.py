@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+from django.core.management import call_command
 from bakery.management.commands.build import Command as Build
+from bigbuild.management.commands.compresspages import Command as CompressPages
 
 
 class Command(Build):
@@ -10,10 +12,58 @@ class Command(Build):
     """
     verbosity = 1
 
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            dest="incremental",
+            default=False,
+            help="Keep the build directory and only rebuild pages that have changed since the last build."
+        )
+        parser.add_argument(
+            "--workers",
+            action="store",
+            dest="workers",
+            type=int,
+            default=1,
+            help="Spread the page builds across this many processes."
+        )
+        parser.add_argument(
+            "--compress",
+            action="store_true",
+            dest="compress",
+            default=False,
+            help="Compress every page's CSS and JavaScript across all CPUs before building the pages."
+        )
+
     def handle(self, *args, **options):
         # Cut out some of the bakery defaults we don't want
         options['skip_static'] = True
         options['skip_media'] = True
 
+        # Incremental builds need the last build's output to stick around
+        self.incremental = options.get('incremental', False)
+        if self.incremental:
+            options['keep_build_dir'] = True
+
+        # Pages can be built across multiple processes
+        self.workers = options.get('workers', 1)
+
+        # Compress all the pages' bundles up front, so the page renders only have to look them up
+        if options.get('compress', False):
+            call_command(CompressPages(), verbosity=options.get('verbosity', 1))
+
         # Run the standard bakery build
         super(Command, self).handle(*args, **options)
+
+    def get_view_instance(self, view):
+        """
+        Passes our options along to the views that support them.
+        """
+        instance = super(Command, self).get_view_instance(view)
+        if hasattr(instance, 'incremental'):
+            instance.incremental = self.incremental
+        if hasattr(instance, 'workers'):
+            instance.workers = self.workers
+        return instance
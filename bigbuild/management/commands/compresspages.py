@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import multiprocessing
+from bigbuild.models import PageList
+from bigbuild.views import PageDetailView
+from bigbuild.workers import map_in_pool
+from bigbuild.manifests import CompressManifest
+from django.core.management.base import BaseCommand
+from bigbuild.rendering import get_page_engine, template_cache
+from bigbuild.compressors import BundleCollector, collect_bundles, compress_bundle, set_offline_bundles
+
+
+class Command(BaseCommand):
+    help = "Compresses the CSS and JavaScript in every page's compress blocks ahead of the build"
+
+    def add_arguments(self, parser):
+        """
+        Custom arguments for this command
+        """
+        parser.add_argument(
+            '--workers',
+            action='store',
+            dest='workers',
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help='Spread the bundles across this many processes. Defaults to the number of CPUs.'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Make it happen.
+        """
+        # Find the bundles in every page's compress blocks, without rendering the rest of the page
+        with BundleCollector() as collector:
+            for obj in PageList.snapshot().dynamic_pages:
+                view = PageDetailView()
+                view.request = view.create_request(view.get_url(obj))
+                view.set_kwargs(obj)
+                view.object = obj
+                template = template_cache.from_file(get_page_engine(), view.get_template_names()[0])
+                collect_bundles(template, view.get_context_data(), view.request)
+
+        # Compress each one once, all at the same time
+        results = map_in_pool(compress_bundle, list(collector.jobs.values()), workers=options['workers'])
+        bundles = dict(results)
+
+        # Save them for the page renders to read from
+        CompressManifest().write(bundles)
+        set_offline_bundles(bundles)
+        self.stdout.write(
+            self.style.SUCCESS('Compressed %s bundles' % len(bundles))
+        )
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import bigbuild
+from bigbuild.caches import FileCache
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Removes entries from bigbuild's caches that haven't been used lately"
+
+    def add_arguments(self, parser):
+        """
+        Custom arguments for this command
+        """
+        parser.add_argument(
+            '--days',
+            action='store',
+            dest='days',
+            type=int,
+            default=30,
+            help='Remove entries that have not been used in this many days. Defaults to 30.'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            dest='all',
+            default=False,
+            help='Remove every entry, no matter how recently it was used'
+        )
+
+    def handle(self, *args, **options):
+        """
+        Make it happen.
+        """
+        max_age = None if options['all'] else options['days'] * 24 * 60 * 60
+        cache_dir = bigbuild.get_cache_directory()
+
+        # Loop through each cache stored in the cache directory
+        for name in sorted(os.listdir(cache_dir)):
+            # Build manifests aren't a cache of their own
+            if name == 'manifests' or not os.path.isdir(os.path.join(cache_dir, name)):
+                continue
+            removed = FileCache(name).prune(max_age)
+            self.stdout.write(
+                self.style.SUCCESS('Removed %s entries from the %s cache' % (removed, name))
+            )
@@ -21,7 +21,7 @@ class Command(BaseCommand):
         # Loop through the slugs
         for slug in options['slug']:
             try:
-                p = PageList()[slug]
+                p = PageList.get_page_by_slug(slug)
             except Exception:
                 raise CommandError("Slug provided (%s) does not exist" % slug)
 
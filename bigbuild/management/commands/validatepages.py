@@ -8,7 +8,11 @@ class Command(BaseCommand):
     help = 'Tests if page directories are valid'
 
     def handle(self, *args, **options):
-        page_list = PageList()
+        # Fully render every page to make sure nothing is broken
+        page_list = PageList(metadata_only=False)
+        # Data files are only parsed when the content uses them, so load every one to check it too
+        for page in page_list:
+            list(page.load_data_objects().values())
         self.stdout.write(
             self.style.SUCCESS('All %s pages are valid' % len(page_list))
         )
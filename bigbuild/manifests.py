@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tools for tracking what went into each page the last time it was built.
+"""
+import io
+import os
+import six
+import json
+import logging
+import bigbuild
+from django.conf import settings
+from django.template import Engine
+from bigbuild.caches import get_fingerprint, make_key
+from django.template.utils import get_app_template_dirs
+logger = logging.getLogger(__name__)
+
+
+class BuildManifest(object):
+    """
+    A record of the inputs each page was built from, used to skip pages that haven't changed since the last build.
+
+    The manifest is stored as JSON in the BIGBUILD_CACHE_DIR, so it never gets published with the build directory.
+    """
+    def __init__(self, fs):
+        # The filesystem the pages are built to
+        self.fs = fs
+        self.build_directory = bigbuild.get_build_directory()
+        self.path = os.path.join(
+            bigbuild.get_cache_directory(),
+            'manifests',
+            '{}.json'.format(make_key(os.path.abspath(self.build_directory)))
+        )
+
+        # Fingerprint everything shared by all of the pages
+        self.environment = self.get_environment_fingerprint()
+
+        # Pull what was recorded last time
+        self.previous_pages, self.previous_environment = self.read()
+
+        # And start a clean slate for this time
+        self.pages = {}
+
+    def read(self):
+        """
+        Returns the pages and environment fingerprint recorded by the last build.
+        """
+        try:
+            with io.open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}, None
+        return data.get('pages', {}), data.get('environment')
+
+    def write(self):
+        """
+        Saves the pages recorded by this build.
+        """
+        dirname = os.path.dirname(self.path)
+        os.path.exists(dirname) or os.makedirs(dirname)
+        data = json.dumps(dict(environment=self.environment, pages=self.pages), indent=2, sort_keys=True)
+        with io.open(self.path, 'w', encoding='utf-8') as f:
+            f.write(six.text_type(data))
+
+    def get_shared_template_directories(self):
+        """
+        Returns the template directories that pages can pull shared templates from.
+
+        The page and archive directories are left out, since each page is fingerprinted on its own.
+        """
+        engine = Engine.get_default()
+        dir_list = list(engine.dirs)
+        if engine.app_dirs:
+            dir_list.extend(get_app_template_dirs('templates'))
+
+        page_directories = [
+            os.path.abspath(bigbuild.get_page_directory()),
+            os.path.abspath(bigbuild.get_archive_directory())
+        ]
+        shared_list = []
+        for d in dir_list:
+            d = os.path.abspath(d)
+            if d in shared_list:
+                continue
+            if any(d == p or d.startswith(p + os.sep) for p in page_directories):
+                continue
+            shared_list.append(d)
+        return shared_list
+
+    def get_environment_fingerprint(self):
+        """
+        Returns a fingerprint of the settings and shared templates that go into every page.
+        """
+        return make_key(
+            bigbuild.__version__,
+            bigbuild.get_base_url(),
+            bigbuild.get_repo_branch(),
+            getattr(settings, 'BAKERY_GZIP', False),
+            getattr(settings, 'COMPRESS_ENABLED', False),
+            getattr(settings, 'BIGBUILD_PAGE_PUBLICATION_STATUS', 'working'),
+            get_fingerprint(*self.get_shared_template_directories())
+        )
+
+    def get_page_fingerprint(self, obj):
+        """
+        Returns a fingerprint of the directory the provided page is built from.
+
+        That includes the metadata, the index template, data files and static files,
+        along with any data files the page pulls in from outside its directory.
+        """
+        return get_fingerprint(os.path.dirname(obj.frontmatter_path), *obj.get_data_paths())
+
+    def is_current(self, obj, fingerprint):
+        """
+        Tests if the provided page was built from the same inputs last time and its output is still there.
+
+        Returns True or False.
+        """
+        if self.environment != self.previous_environment:
+            return False
+        entry = self.previous_pages.get(obj.slug)
+        if not entry or entry['fingerprint'] != fingerprint:
+            return False
+        return self.fs.exists(entry['path'])
+
+    def add(self, obj, fingerprint):
+        """
+        Records that the provided page has been built from the provided fingerprint.
+        """
+        self.pages[obj.slug] = dict(
+            fingerprint=fingerprint,
+            path=obj.build_directory_path
+        )
+
+    def prune(self):
+        """
+        Deletes the output of any pages built last time that were not recorded this time.
+        """
+        for slug, entry in self.previous_pages.items():
+            if slug in self.pages:
+                continue
+            if self.fs.exists(entry['path']):
+                logger.debug("Removing {}, its page no longer exists".format(entry['path']))
+                self.fs.removetree(entry['path'])
+
+
+class CompressManifest(object):
+    """
+    The output of the compress blocks across every page, compressed ahead of the build by the compresspages command.
+
+    The manifest is stored as JSON in the BIGBUILD_CACHE_DIR, alongside the build manifest.
+    """
+    def __init__(self):
+        self.path = os.path.join(
+            bigbuild.get_cache_directory(),
+            'manifests',
+            'compress-{}.json'.format(make_key(os.path.abspath(bigbuild.get_build_directory())))
+        )
+
+    def read(self):
+        """
+        Returns the bundles recorded by the last run, keyed by bigbuild.compressors.get_bundle_key.
+        """
+        try:
+            with io.open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('bundles', {})
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def write(self, bundles):
+        """
+        Saves the provided bundles.
+        """
+        dirname = os.path.dirname(self.path)
+        os.path.exists(dirname) or os.makedirs(dirname)
+        data = json.dumps(dict(bundles=bundles), indent=2, sort_keys=True)
+        with io.open(self.path, 'w', encoding='utf-8') as f:
+            f.write(six.text_type(data))
@@ -1,24 +1,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
-import csv
-import copy
-import json
-import yaml
-import archieml
-import codecs
 import logging
 import bigbuild
 import jsonfield
 from django.db import models
 from datetime import datetime
+from bigbuild.data import LazyDataObjects, get_data_options, get_parser
 from django.conf import settings
 from django.utils import timezone
 from greeking import latimes_ipsum
-from django.test import RequestFactory
 from bigbuild import context_processors
+from bigbuild.rendering import PageProxy, get_page_engine, get_request, template_cache
 from bigbuild.serializers import deserializers
-from django.template import Engine, RequestContext
+from django.template import RequestContext
 from django.utils.encoding import python_2_unicode_compatible
 logger = logging.getLogger(__name__)
 
@@ -61,54 +56,76 @@ class BasePage(models.Model):
     # Dynamic content
     #
 
+    def get_data_path(self, path):
+        """
+        Returns the full path to the provided data file, or None if it cannot be found.
+        """
+        # Generate the path if it's stored in the default `data` directory
+        p = os.path.join(self.page_directory_path, 'data', path)
+        # If it doesn't exist, see if it's in another folder
+        if not os.path.exists(p):
+            p = os.path.join(self.page_directory_path, path)
+            # If it's not there either, give up
+            if not os.path.exists(p):
+                logging.debug("Data file could not be found at %s" % p)
+                return None
+        return p
+
+    def get_data_paths(self):
+        """
+        Returns the full path to each of the page's data files that can be found, wherever they are stored.
+        """
+        path_list = [self.get_data_path(get_data_options(v)[0]) for v in self.data.values()]
+        return [p for p in path_list if p]
+
     def set_data_objects(self):
+        """
+        Sets the page's data_objects to a mapping of its data files, which are parsed the first time they're used.
+        """
+        paths = {}
+        options = {}
         # Loop through any data files
-        for key, path in self.data.items():
+        for key, value in self.data.items():
+            path, options[key] = get_data_options(value)
+            p = self.get_data_path(path)
+            if not p:
+                continue
 
-            # Generate the path if it's stored in the default `data` directory
-            data_dir = os.path.join(self.page_directory_path, 'data')
-            p = os.path.join(data_dir, path)
-            # If it doesn't exist, see if it's in another folder
-            if not os.path.exists(p):
-                p = os.path.join(self.page_directory_path, path)
-                # If it's not there either, throw an error
-                if not os.path.exists(p):
-                    logging.debug("Data file could not be found at %s" % p)
-                    continue
-
-            # Open the file
-            with codecs.open(p, 'r') as f:
-                # If it's a CSV file open it that way...
-                if p.endswith(".csv"):
-                    self.data_objects[key] = list(csv.DictReader(f))
-                # If it's a JSON file open it this way ...
-                elif p.endswith(".json"):
-                    self.data_objects[key] = json.load(f)
-                # If it's a YAML file open it t'other way ...
-                elif (p.endswith(".yml") or p.endswith(".yaml")):
-                    self.data_objects[key] = yaml.load(f)
-                elif p.endswith(".aml"):
-                    self.data_objects[key] = archieml.load(f)
-                # If it's none of those throw an error.
-                else:
-                    logging.debug("Data file at %s not recognizable type" % path)
+            # If it's not a CSV, JSON, YAML or ArchieML file, skip it
+            if not get_parser(p):
+                logging.debug("Data file at %s not recognizable type" % path)
+                continue
+
+            paths[key] = p
+        self.data_objects = LazyDataObjects(paths, options)
+
+    def load_data_objects(self):
+        """
+        Returns a mapping of the page's data files as Python objects, setting it up first if that hasn't been done yet.
+
+        Pages that use the same data file share the same objects, so they should be treated as read only.
+        """
+        if self.data and getattr(self, 'data_objects', None) is None:
+            self.set_data_objects()
+        data_objects = getattr(self, 'data_objects', None)
+        return {} if data_objects is None else data_objects
 
     @property
     def rendered_content(self):
         """
         Returns the page's contents, which can contain Django templating tags, rendered as simple HTML.
         """
-        engine = Engine.get_default()
-        engine.dirs.extend([
-            bigbuild.get_page_directory(),
-            os.path.join(bigbuild.get_archive_directory(), 'static')
-        ])
-        template = engine.from_string(self.content)
-        obj = copy.deepcopy(self)
-        obj.set_data_objects()
-        obj.data = obj.data_objects
+        return self.render_content(self.content)
+
+    def render_content(self, source):
+        """
+        Returns the provided page content, which can contain Django templating tags, rendered as simple HTML.
+        """
+        template = template_cache.from_string(get_page_engine(), source)
+        # Swap the data in on a read-only proxy so the page itself is left alone
+        obj = PageProxy(self, content=source, data=self.load_data_objects())
         context = RequestContext(
-            RequestFactory().get(self.get_absolute_url()),
+            get_request(self.get_absolute_url()),
             {
                 "object": obj,
                 'STATIC_URL': obj.get_static_url()
@@ -150,8 +167,8 @@ class BasePage(models.Model):
         # Create the object
         obj = cls(**fields)
 
-        # Cache attribute to store rendered data files
-        obj.data_objects = {}
+        # Cache attribute to store rendered data files, which are mapped out the first time they're needed
+        obj.data_objects = None if obj.data else {}
 
         if not skip_create_directory:
 
@@ -186,6 +203,18 @@ class BasePage(models.Model):
         view = PageDetailView()
         view.build_object(self)
 
+    def refresh_from_db(self, using=None, fields=None):
+        """
+        Reloads the page from its frontmatter, since pages are not stored in a database.
+
+        Django calls this to fill in deferred fields, which is how pages
+        loaded with only their metadata render their content on first access.
+        """
+        if fields == ['content'] and getattr(self, 'content_source', None) is not None:
+            self.content = self.render_content(self.content_source)
+        else:
+            self.refresh_from_yaml()
+
     def refresh_from_yaml(self):
         """
         Reads in the frontmatter from metadata.yaml and syncs it with the object.
@@ -194,7 +223,7 @@ class BasePage(models.Model):
         yaml_obj = deserializer.deserialize(self.slug)
         for field in yaml_obj._meta.fields:
             setattr(self, field.name, getattr(yaml_obj, field.name))
-        self.data_objects = yaml_obj.data_objects or {}
+        self.data_objects = getattr(yaml_obj, 'data_objects', None)
 
     #
     # File pathing
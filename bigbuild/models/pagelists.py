@@ -4,8 +4,13 @@ import os
 import six
 import logging
 import bigbuild
+import threading
 from django.conf import settings
+from django.utils import timezone
 from collections import Sequence
+from bigbuild.workers import map_in_pool
+from django.dispatch import receiver
+from django.core.signals import setting_changed
 from bigbuild.serializers import deserializers
 from bigbuild.serializers import BigBuildJSONDeserializer
 logger = logging.getLogger(__name__)
@@ -14,8 +19,19 @@ logger = logging.getLogger(__name__)
 class PageList(Sequence):
     """
     A list of all the Page and ArchivedPage objects in the application.
+
+    By default pages are loaded with only their metadata and their content is
+    rendered the first time it is accessed. Pass metadata_only=False to render
+    everything up front.
     """
-    def __init__(self):
+    # A process-wide copy of the list shared by PageList.snapshot
+    _snapshot = None
+    _snapshot_key = None
+    _snapshot_lock = threading.Lock()
+
+    def __init__(self, metadata_only=True):
+        self.metadata_only = metadata_only
+
         # Set the page directories
         self.dynamic_directory = bigbuild.get_page_directory()
         self.archived_directory = bigbuild.get_archive_directory()
@@ -23,6 +39,9 @@ class PageList(Sequence):
         # Set the cache path
         self.archived_cache_path = os.path.join(self.archived_directory, '.cache')
 
+        # When the next pending page goes live, which is noted as the pages are pulled
+        self.next_pub_date = None
+
         # Pull the pages
         self.dynamic_pages = self.get_dynamic_pages()
         self.archived_pages = self.get_archived_pages()
@@ -42,6 +61,11 @@ class PageList(Sequence):
         # Then sort the working pages to the top
         self.pages = sorted(self.pages, key=lambda o: o.is_live())
 
+        # Index the pages by slug, keeping the first one in case of duplicates
+        self.page_index = {}
+        for p in self.pages:
+            self.page_index.setdefault(p.slug, p)
+
     def __iter__(self):
         """
         What to use when this PageList is used in a for loop.
@@ -60,8 +84,8 @@ class PageList(Sequence):
         """
         if isinstance(key, six.string_types):
             try:
-                return [i for i in self.pages if i.slug == key][0]
-            except IndexError:
+                return self.page_index[key]
+            except KeyError:
                 raise KeyError("No page with that slug was found")
         elif isinstance(key, int):
             try:
@@ -69,14 +93,96 @@ class PageList(Sequence):
             except IndexError:
                 raise IndexError("No page with this key could be found")
 
+    @classmethod
+    def snapshot(cls):
+        """
+        Returns a PageList shared across the process.
+
+        The list is reloaded when a page is added, removed or has its metadata edited,
+        and when a pending page's publication date passes.
+        """
+        key = cls.get_snapshot_key()
+        with cls._snapshot_lock:
+            if (
+                cls._snapshot is None or
+                cls._snapshot_key != key or
+                (cls._snapshot.next_pub_date and cls._snapshot.next_pub_date <= timezone.now())
+            ):
+                logger.debug("Loading a new PageList snapshot")
+                cls._snapshot = cls()
+                cls._snapshot_key = key
+            return cls._snapshot
+
+    @staticmethod
+    def get_snapshot_key():
+        """
+        Returns a cheap fingerprint of the page and archive directories for the snapshot to be keyed on.
+
+        Rather than walk every file, it only looks at the modification times of the directories
+        holding the pages, each page's directory and each page's metadata.md.
+        """
+        dynamic_directory = bigbuild.get_page_directory()
+        archived_directory = bigbuild.get_archive_directory()
+        static_archive_path = os.path.join(archived_directory, 'static')
+        path_list = [
+            dynamic_directory,
+            archived_directory,
+            static_archive_path,
+            os.path.join(archived_directory, '.cache')
+        ]
+        for directory in [dynamic_directory, static_archive_path]:
+            try:
+                slug_list = sorted(os.listdir(directory))
+            except OSError:
+                continue
+            for slug in slug_list:
+                path_list.append(os.path.join(directory, slug))
+                path_list.append(os.path.join(directory, slug, 'metadata.md'))
+
+        key = [dynamic_directory, archived_directory]
+        for p in path_list:
+            try:
+                st = os.stat(p)
+            except OSError:
+                # It doesn't exist, or was removed while we were looking
+                continue
+            key.append((p, st.st_size, st.st_mtime))
+        return tuple(key)
+
+    @classmethod
+    def clear_snapshot(cls):
+        """
+        Throws out the shared PageList so that the next snapshot is reloaded from the filesystem.
+        """
+        with cls._snapshot_lock:
+            cls._snapshot = None
+            cls._snapshot_key = None
+
     @staticmethod
-    def get_page(slug, pagetype):
+    def get_page(slug, pagetype, metadata_only=False):
         """
         Returns a list of Page objects from the provided slug directory.
         """
         # Create an object from the directory slug
         deserializer = deserializers[pagetype]()
-        return deserializer.deserialize(slug)
+        return deserializer.deserialize(slug, metadata_only=metadata_only)
+
+    @classmethod
+    def get_page_by_slug(cls, slug, metadata_only=False):
+        """
+        Returns the Page or ArchivedPage with the provided slug.
+
+        Only that page's directory is deserialized, so the rest of the list is never loaded.
+        """
+        blacklist = getattr(settings, 'BIGBUILD_PAGE_BLACKLIST', ['.DS_Store'])
+        if slug and slug not in blacklist:
+            # Check if it is a dynamic page
+            if os.path.isdir(os.path.join(bigbuild.get_page_directory(), slug)):
+                return cls.get_page(slug, 'Page', metadata_only=metadata_only)
+            # Then check if it is an archived page
+            if os.path.isdir(os.path.join(bigbuild.get_archive_directory(), 'static', slug)):
+                return cls.get_page(slug, 'ArchivedPage', metadata_only=metadata_only)
+        raise KeyError("No page with that slug was found")
 
     def get_directory_list(self, path):
         """
@@ -92,14 +198,40 @@ class PageList(Sequence):
         # Return what remains
         return dir_list
 
+    def deserialize_pages(self, dir_list, pagetype):
+        """
+        Returns a list of objects of the provided type deserialized from each slug in the directory list.
+
+        The work is spread across a pool of processes when the BIGBUILD_LOAD_WORKERS setting is more than one.
+        """
+        workers = getattr(settings, 'BIGBUILD_LOAD_WORKERS', 1)
+        return map_in_pool(
+            deserialize_page,
+            [(d, pagetype, self.metadata_only) for d in dir_list],
+            workers=workers
+        )
+
+    def filter_pages(self, page_list):
+        """
+        Returns the pages in the provided list that are ready to be built in this environment.
+
+        Along the way it notes the earliest publication date of any pending pages, so the snapshot
+        knows when it has to be reloaded to pick them up.
+        """
+        for p in page_list:
+            if p.pub_status == 'pending':
+                pub_date = timezone.make_aware(p.pub_date)
+                if self.next_pub_date is None or pub_date < self.next_pub_date:
+                    self.next_pub_date = pub_date
+        return [p for p in page_list if p.should_build()]
+
     def get_dynamic_pages(self):
         """
         Returns a list of Page objects ready to be built in this environment.
         """
         dir_list = self.get_directory_list(self.dynamic_directory)
-        deserializer = deserializers['Page']()
-        page_list = [deserializer.deserialize(d) for d in dir_list]
-        page_list = [p for p in page_list if p.should_build()]
+        page_list = self.deserialize_pages(dir_list, 'Page')
+        page_list = self.filter_pages(page_list)
         logger.debug("{} dynamic pages retrieved from YAML".format(len(page_list)))
         return page_list
 
@@ -110,19 +242,32 @@ class PageList(Sequence):
         # Pull the cached data if it exists
         if os.path.exists(self.archived_cache_path):
             with open(self.archived_cache_path, 'r') as f:
-                page_list = [
-                    o.object for o in
-                    BigBuildJSONDeserializer(f.read())
-                    if o.object.should_build()
-                ]
+                page_list = self.filter_pages([o.object for o in BigBuildJSONDeserializer(f.read())])
             logger.debug("{} archived pages retrieved from cache".format(len(page_list)))
             return page_list
 
         # Otherwise get them from the YAML
         static_archive_path = os.path.join(self.archived_directory, 'static')
         dir_list = self.get_directory_list(static_archive_path)
-        deserializer = deserializers['ArchivedPage']()
-        page_list = [deserializer.deserialize(d) for d in dir_list]
-        page_list = [p for p in page_list if p.should_build()]
+        page_list = self.deserialize_pages(dir_list, 'ArchivedPage')
+        page_list = self.filter_pages(page_list)
         logger.debug("{} archived pages retrieved from YAML".format(len(page_list)))
         return page_list
+
+
+def deserialize_page(args):
+    """
+    Returns the object deserialized from the provided slug, type and metadata_only flag.
+
+    Accepts a single tuple so it can be mapped across PageList's worker pool.
+    """
+    slug, pagetype, metadata_only = args
+    return PageList.get_page(slug, pagetype, metadata_only=metadata_only)
+
+
+@receiver(setting_changed)
+def clear_page_list_snapshot(**kwargs):
+    """
+    Throws out the shared PageList whenever the settings change.
+    """
+    PageList.clear_snapshot()
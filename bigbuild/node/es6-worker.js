@@ -0,0 +1,66 @@
+#!/usr/bin/env node
+/*
+ * A long-lived ES6 compiler for bigbuild's CompilerPool.
+ *
+ * Reads one job per line of JSON on stdin, bundles it with browserify and babelify,
+ * and writes the result as one line of JSON on stdout. Jobs are run one at a time,
+ * and the modules they load stay in memory for the next.
+ */
+var path = require('path');
+var stream = require('stream');
+var readline = require('readline');
+
+function compile(job, callback) {
+  var options = job.options;
+  var browserify = require(path.join(options.node_modules, 'browserify'));
+  var babelify = require(path.join(options.node_modules, 'babelify'));
+
+  // Feed the source in as a stream, the way the command line tool reads a file
+  var source = new stream.Readable();
+  source.push(job.source);
+  source.push(null);
+
+  var bundler = browserify(source, {
+    basedir: options.basedir || process.cwd(),
+    paths: options.paths
+  });
+  bundler.transform(babelify, {
+    presets: [path.join(options.node_modules, 'babel-preset-es2015')]
+  });
+  bundler.bundle(function (err, buffer) {
+    if (err) {
+      callback({id: job.id, error: String(err.stack || err)});
+    } else {
+      callback({id: job.id, output: buffer.toString('utf8')});
+    }
+  });
+}
+
+var jobs = [];
+var running = false;
+
+function next() {
+  if (running || !jobs.length) {
+    return;
+  }
+  running = true;
+  var job = jobs.shift();
+  try {
+    compile(job, finish);
+  } catch (err) {
+    finish({id: job.id, error: String(err.stack || err)});
+  }
+}
+
+function finish(result) {
+  process.stdout.write(JSON.stringify(result) + '\n');
+  running = false;
+  next();
+}
+
+readline.createInterface({input: process.stdin, terminal: false}).on('line', function (line) {
+  if (line.trim()) {
+    jobs.push(JSON.parse(line));
+    next();
+  }
+});
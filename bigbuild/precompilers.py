@@ -5,17 +5,87 @@ Slimmed down subclasses of django-compressor internals that aim to work
 without django.contrib.staticfiles installed.
 """
 import os
+import bigbuild
 from django.apps import apps
+from django.conf import settings
 from bigbuild.models import PageList
+from compressor.exceptions import FilterError
+from bigbuild.exceptions import CompilerError
+from bigbuild.workers import get_compiler_pool
+from bigbuild.caches import get_fingerprint, get_file_hash, get_content_fingerprint, walk_files
 from compressor_toolkit.precompilers import BaseCompiler
 toolkit_config = apps.get_app_config('compressor_toolkit')
 
+# The node script the ES6 compiler pool runs by default
+ES6_WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), 'node', 'es6-worker.js')
+
 
 def get_all_static():
     """
     Returns the static directory path of all dynamic pages.
     """
-    return [os.path.join(p.page_directory_path, 'static') for p in PageList().dynamic_pages]
+    return [os.path.join(p.page_directory_path, 'static') for p in PageList.snapshot().dynamic_pages]
+
+
+def get_page_static(filename):
+    """
+    Returns the static directory of the dynamic page the provided file belongs to, or None if it isn't in one.
+    """
+    page_directory = os.path.abspath(bigbuild.get_page_directory())
+    relative_path = os.path.relpath(os.path.abspath(filename), page_directory)
+    if relative_path.startswith(os.pardir + os.sep) or os.sep not in relative_path:
+        return None
+    slug = relative_path.split(os.sep)[0]
+    return os.path.join(page_directory, slug, 'static')
+
+
+# The file extensions the module resolver can import
+MODULE_EXTENSIONS = ('.js', '.mjs', '.json')
+
+# The content fingerprint last taken of each source directory, with the stat fingerprint it was taken at
+_source_fingerprints = {}
+
+
+def get_module_files(path):
+    """
+    Returns the path of every file in the provided directory that can be imported as a module, in a stable order.
+    """
+    return [f for f in walk_files(path) if f.lower().endswith(MODULE_EXTENSIONS)]
+
+
+def get_source_fingerprint(path):
+    """
+    Returns a hash of the contents of every module file in the provided directory.
+
+    Images and other static files are left out, since they can't be imported.
+    The contents are only read again when a module file's name, size or modification time changes.
+    """
+    file_list = get_module_files(path)
+    stat_fingerprint = get_fingerprint(*file_list) if file_list else None
+    try:
+        cached_stat_fingerprint, content_fingerprint = _source_fingerprints[path]
+        if cached_stat_fingerprint == stat_fingerprint:
+            return content_fingerprint
+    except KeyError:
+        pass
+    content_fingerprint = get_content_fingerprint(file_list, path)
+    _source_fingerprints[path] = (stat_fingerprint, content_fingerprint)
+    return content_fingerprint
+
+
+def get_node_modules_fingerprint(path):
+    """
+    Returns a hash of the packages installed in the provided node_modules directory.
+
+    Rather than read every package, it goes by the names at the top of the directory and npm's lock file.
+    """
+    if not os.path.isdir(path):
+        return None
+    parts = sorted(os.listdir(path))
+    lock_path = os.path.join(path, '.package-lock.json')
+    if os.path.exists(lock_path):
+        parts.append(get_file_hash(lock_path))
+    return ":".join(parts)
 
 
 class ES6Compiler(BaseCompiler):
@@ -23,10 +93,91 @@ class ES6Compiler(BaseCompiler):
     django-compressor pre-compiler for ES6 files.
     """
     command = toolkit_config.ES6_COMPILER_CMD
-    options = (
-        ('browserify_bin', toolkit_config.BROWSERIFY_BIN),
-        # Pull all the static file paths from dynamic pages plus the node_modules install directory
-        ('paths', os.pathsep.join(get_all_static() + [toolkit_config.NODE_MODULES])),
-        ('node_modules', toolkit_config.NODE_MODULES)
-    )
     infile_ext = '.js'
+    # Always compile the content passed in, which SimpleCompressor has already rendered.
+    # The filename is only used to find the page the code belongs to.
+    compiles_content = True
+
+    def __init__(self, content, command=None, **kwargs):
+        super(ES6Compiler, self).__init__(content, command=command, **kwargs)
+        # Figure out the options when a file is compiled, rather than when this module is imported,
+        # keeping any passed in as keyword arguments at the end so they win out.
+        self.options = self.get_options() + tuple(self.options)
+
+    def get_options(self):
+        """
+        Returns the options passed to the compiler command.
+        """
+        return (
+            ('browserify_bin', toolkit_config.BROWSERIFY_BIN),
+            ('paths', os.pathsep.join(self.get_paths())),
+            ('node_modules', toolkit_config.NODE_MODULES)
+        )
+
+    def get_paths(self):
+        """
+        Returns the directories modules can be required from.
+
+        Files in a page's directory can only pull from that page's static directory,
+        the node_modules install directory and any directories in the BIGBUILD_ES6_PATHS setting.
+        Code from anywhere else, like inline scripts, can also pull from every page's static directory.
+        """
+        shared_paths = list(getattr(settings, 'BIGBUILD_ES6_PATHS', [])) + [toolkit_config.NODE_MODULES]
+        page_static = get_page_static(self.filename) if self.filename else None
+        if page_static:
+            return [page_static] + shared_paths
+        return get_all_static() + shared_paths
+
+    def input(self, **kwargs):
+        """
+        Compiles the code on a pool of long-lived node processes if the BIGBUILD_ES6_WORKERS setting is
+        more than zero, rather than starting a new one for each file.
+
+        The pool runs the command in the BIGBUILD_ES6_WORKER_COMMAND setting, which defaults to bigbuild's
+        own browserify worker script. Workers are replaced after BIGBUILD_ES6_WORKER_MAX_JOBS jobs,
+        100 by default, and given BIGBUILD_ES6_WORKER_TIMEOUT seconds to finish each one, 120 by default.
+
+        The workers always run their own browserify pipeline, so if the COMPRESS_ES6_COMPILER_CMD setting
+        has been changed, the command is started for each file as usual.
+        """
+        workers = getattr(settings, 'BIGBUILD_ES6_WORKERS', 0)
+        if not workers or hasattr(settings, 'COMPRESS_ES6_COMPILER_CMD'):
+            # Hide the filename so the command is handed the rendered content in a temporary file
+            filename, self.filename = self.filename, None
+            try:
+                return super(ES6Compiler, self).input(**kwargs)
+            finally:
+                self.filename = filename
+
+        pool = get_compiler_pool(
+            getattr(settings, 'BIGBUILD_ES6_WORKER_COMMAND', ['node', ES6_WORKER_SCRIPT]),
+            size=workers,
+            max_jobs=getattr(settings, 'BIGBUILD_ES6_WORKER_MAX_JOBS', 100),
+            timeout=getattr(settings, 'BIGBUILD_ES6_WORKER_TIMEOUT', 120)
+        )
+        options = dict(self.options)
+        try:
+            return pool.compile(
+                self.content,
+                paths=options['paths'].split(os.pathsep),
+                node_modules=options['node_modules'],
+                basedir=os.path.dirname(self.filename) if self.filename else None
+            )
+        except CompilerError as e:
+            raise FilterError(e)
+
+    def get_cache_key_parts(self):
+        """
+        Returns what goes into the compiled output other than the code itself, for SimpleCompressor's cache.
+
+        That's the command, its options and the module files in every directory they can be required from.
+        """
+        options = dict(self.options)
+        parts = [self.command]
+        parts.extend("{}={}".format(k, v) for k, v in sorted(options.items()) if k not in ('infile', 'outfile'))
+        for path in options['paths'].split(os.pathsep):
+            if path == toolkit_config.NODE_MODULES:
+                parts.append(get_node_modules_fingerprint(path))
+            else:
+                parts.append(get_source_fingerprint(path))
+        return parts
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tools for rendering page content and templates.
+"""
+import io
+import os
+import six
+import copy
+import weakref
+import hashlib
+import logging
+import bigbuild
+import threading
+from django.conf import settings
+from django.template import Engine
+from bigbuild.caches import LRUCache
+from django.template.context import make_context
+from django.template.base import Origin, Template
+from django.utils.encoding import python_2_unicode_compatible
+logger = logging.getLogger(__name__)
+
+
+class TemplateCache(object):
+    """
+    Remembers compiled page templates, so unchanged page content and index.html files skip Django's template compiler.
+
+    Templates are kept separately for each template engine, and forgotten along with the engine if it is replaced.
+    The least recently used are dropped once an engine has more than the BIGBUILD_TEMPLATE_CACHE_SIZE setting.
+    It defaults to 1000.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Empties the cache and resets the counters.
+        """
+        with self.lock:
+            self.engines = weakref.WeakKeyDictionary()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'BIGBUILD_TEMPLATE_CACHE_SIZE', 1000)
+
+    def get(self, engine, key, compile):
+        """
+        Returns the template stored for the provided engine with the provided key.
+
+        If there isn't one, the provided function is called to compile it, and the result is saved.
+        """
+        with self.lock:
+            entries = self.engines.setdefault(engine, LRUCache())
+            template = entries.get(key)
+            if template is not None:
+                self.hits += 1
+                return template
+            self.misses += 1
+
+        # Compile outside the lock so other threads aren't held up
+        template = compile()
+
+        with self.lock:
+            entries.set(key, template, self.max_size)
+        return template
+
+    def from_string(self, engine, source):
+        """
+        Returns a template compiled from the provided source code by the provided engine.
+        """
+        key = ('string', hashlib.sha1(source.encode("utf-8")).hexdigest())
+        return self.get(engine, key, lambda: engine.from_string(source))
+
+    def from_file(self, engine, path):
+        """
+        Returns a template compiled from the file at the provided path by the provided engine.
+
+        The file's size and modification time are part of the key, so edits are picked up right away.
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = ('file', path, st.st_size, st.st_mtime)
+
+        def compile():
+            with io.open(path, 'r', encoding=engine.file_charset) as f:
+                source = f.read()
+            return Template(source, origin=Origin(path, template_name=path), name=path, engine=engine)
+        return self.get(engine, key, compile)
+
+
+class BackendTemplate(object):
+    """
+    Wraps a compiled template so it can be handed to a TemplateResponse, the way Django's template backends do.
+    """
+    def __init__(self, template):
+        self.template = template
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        context = make_context(context, request, autoescape=self.template.engine.autoescape)
+        return self.template.render(context)
+
+
+@python_2_unicode_compatible
+class PageProxy(object):
+    """
+    A read-only stand-in for a page that swaps in the provided attributes without copying the page itself.
+
+    Everything else is looked up on the page, so templates can't tell the difference.
+    """
+    def __init__(self, page, **overrides):
+        object.__setattr__(self, '_page', page)
+        object.__setattr__(self, '_overrides', overrides)
+
+    def __getattr__(self, name):
+        overrides = object.__getattribute__(self, '_overrides')
+        if name in overrides:
+            return overrides[name]
+        return getattr(object.__getattribute__(self, '_page'), name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is read only".format(self))
+
+    def __str__(self):
+        return six.text_type(self._page)
+
+    def __repr__(self):
+        return "<PageProxy: {!r}>".format(self._page)
+
+
+# The fake requests pages are rendered with, keyed by the base URL they were made for
+_requests = {}
+
+
+def get_request(path):
+    """
+    Returns a fake GET request for the provided path, to render page content with.
+
+    Making a request from scratch is slow, so one is made for each base URL and copied with the path swapped in.
+    The copies share everything else, so they should be treated as read only.
+    """
+    base_url = bigbuild.get_base_url()
+    try:
+        base_request = _requests[base_url]
+    except KeyError:
+        # django.test is slow to import, so only pull it in once it's needed
+        from django.test import RequestFactory
+        base_request = _requests[base_url] = RequestFactory().get(base_url)
+    request = copy.copy(base_request)
+    request.path = request.path_info = path
+    request.META = dict(base_request.META, PATH_INFO=path)
+    return request
+
+
+# The engine pages are rendered with, and the configuration it was made from
+_page_engine = (None, None)
+_page_engine_lock = threading.Lock()
+
+
+def get_page_engine():
+    """
+    Returns the template engine bigbuild renders page content and index.html files with.
+
+    It is a copy of the project's default Django template engine, with the page directory and
+    the archive's static directory added to the end of its search path. The engine is built once
+    and reused, so the search path stays the same size however many pages are rendered, and the
+    project's own engine is never modified. A new one is made if the settings it copies change.
+    """
+    global _page_engine
+    default = Engine.get_default()
+    page_dirs = [
+        bigbuild.get_page_directory(),
+        os.path.join(bigbuild.get_archive_directory(), 'static')
+    ]
+    key = (default, tuple(page_dirs))
+    with _page_engine_lock:
+        if _page_engine[0] != key:
+            # Django won't accept app_dirs alongside loaders, so let it configure them itself in that case
+            loaders = None if default.app_dirs else default.loaders
+            engine = Engine(
+                dirs=list(default.dirs) + [d for d in page_dirs if d not in default.dirs],
+                app_dirs=default.app_dirs,
+                context_processors=default.context_processors,
+                debug=default.debug,
+                loaders=loaders,
+                string_if_invalid=default.string_if_invalid,
+                file_charset=default.file_charset,
+                libraries=default.libraries,
+                builtins=[b for b in default.builtins if b not in Engine.default_builtins],
+                autoescape=default.autoescape
+            )
+            _page_engine = (key, engine)
+        return _page_engine[1]
+
+
+# The cache shared by every page in this process
+template_cache = TemplateCache()
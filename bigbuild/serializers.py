@@ -1,18 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import re
 import six
 import sys
-import csv
 import json
 import yaml
-import codecs
 import logging
-import archieml
+import bigbuild
 import validictory
 import frontmatter
 from django.apps import apps
 from datetime import datetime
+from django.conf import settings
+from bigbuild import caches
+from django.utils.module_loading import import_string
+from bigbuild.data import get_data_options
 from django.core.serializers.base import DeserializationError
 from bigbuild.exceptions import MissingRecommendedMetadataWarning
 from django.core.serializers.json import Serializer as JSONSerializer
@@ -47,6 +50,70 @@ def BigBuildJSONDeserializer(stream_or_string, **options):
         six.reraise(DeserializationError, DeserializationError(e), sys.exc_info()[2])
 
 
+class FrontmatterParser(object):
+    """
+    Parses metadata.md files with the python-frontmatter library.
+    """
+    def load(self, stream):
+        """
+        Returns a frontmatter Post parsed from the provided file object.
+        """
+        return frontmatter.load(stream)
+
+
+class FastFrontmatterParser(FrontmatterParser):
+    """
+    Parses metadata.md files by splitting off the YAML header itself and handing it straight to libyaml.
+
+    Skips python-frontmatter's format detection and its regular expression split of the whole file.
+    Uses yaml.CSafeLoader when PyYAML was built with libyaml, and the pure Python yaml.SafeLoader when it was not.
+    Anything other than a plain "---" YAML header is passed along to python-frontmatter.
+    """
+    BOUNDARY = re.compile(r'^-{3,}$', re.MULTILINE)
+    Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+    def load(self, stream):
+        text = stream.read()
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        return self.loads(text) or frontmatter.loads(text)
+
+    def loads(self, text):
+        """
+        Returns a frontmatter Post parsed from the provided text, or None if it doesn't have a plain YAML header.
+        """
+        text = text.strip()
+
+        # The first line has to be nothing but dashes
+        first_break = text.find('\n')
+        if first_break < 3 or not self.BOUNDARY.match(text, 0, first_break):
+            return None
+
+        # Find the line that closes the header
+        closing = self.BOUNDARY.search(text, first_break + 1)
+        if not closing:
+            return None
+
+        metadata = yaml.load(text[first_break + 1:closing.start()], Loader=self.Loader)
+        if not isinstance(metadata, dict):
+            metadata = {}
+        return frontmatter.Post(
+            text[closing.end():].strip(),
+            frontmatter.YAMLHandler(),
+            **metadata
+        )
+
+
+def get_frontmatter_parser():
+    """
+    Returns the frontmatter parser set by the BIGBUILD_FRONTMATTER_PARSER setting.
+
+    The setting is the dotted path to a class like FrontmatterParser. Defaults to FastFrontmatterParser.
+    """
+    path = getattr(settings, 'BIGBUILD_FRONTMATTER_PARSER', 'bigbuild.serializers.FastFrontmatterParser')
+    return import_string(path)()
+
+
 class BigBuildFrontmatterSerializer(YAMLSerializer):
     """
     A custom YAML frontmatter serializer for bigbuild models.
@@ -117,9 +184,12 @@ class BaseBigBuildFrontmatterDeserializer(object):
     """
     Abstract method for deserializing YAML data from Jekyll's frontmatter format.
     """
-    def deserialize(self, slug):
+    def deserialize(self, slug, metadata_only=False):
         """
         Retrieves the provided slug and returns a bigbuild object
+
+        If metadata_only is True, data files are not loaded and the content
+        is not rendered until it is first accessed.
         """
         logger.debug("Retrieving {} as {} object".format(
             slug,
@@ -127,20 +197,30 @@ class BaseBigBuildFrontmatterDeserializer(object):
         ))
         obj = self.model.create(slug=slug, skip_create_directory=True)
         try:
+            # Parse the YAML frontmatter once and share it with every step that follows
+            post = self.load_frontmatter(obj)
             # Sync the metadata from the YAML frontmatter with the object
-            obj = self.set_metadata(obj)
+            obj = self.set_metadata(obj, post, metadata_only=metadata_only)
             # Pass it out
             return obj
         except Exception as e:
-            # Map to deserializer error
-            six.reraise(DeserializationError, DeserializationError(e), sys.exc_info()[2])
+            # Map to deserializer error that names the page
+            error = DeserializationError("Could not deserialize {}: {}".format(slug, e))
+            six.reraise(DeserializationError, error, sys.exc_info()[2])
+
+    def load_frontmatter(self, obj):
+        """
+        Returns the parsed YAML frontmatter document for the provided bigbuild model object.
+        """
+        with open(obj.frontmatter_path, 'r') as stream:
+            return get_frontmatter_parser().load(stream)
 
-    def set_metadata(self, obj):
+    def set_metadata(self, obj, post=None, metadata_only=False):
         """
         Syncs metadata with YAML frontmatter with provided bigbuild model object.
         """
-        stream = open(obj.frontmatter_path, 'r')
-        post = frontmatter.load(stream)
+        if post is None:
+            post = self.load_frontmatter(obj)
 
         # Set the basic frontmatter metadata
         obj.headline = post.metadata['headline']
@@ -162,11 +242,22 @@ class BaseBigBuildFrontmatterDeserializer(object):
         except KeyError:
             obj.data = {}
 
-        # Pull in the content as is
-        obj.content = post.content
+        if metadata_only:
+            # Hold on to the content as is and defer the field,
+            # so it is only rendered when something asks for it.
+            obj.content_source = post.content
+            del obj.content
+            # Leave any data files to be mapped out then too
+            obj.data_objects = None if obj.data else {}
+        else:
+            # Map out the data files so the rendering below can pull in the ones it uses
+            self.set_data_objects(obj)
 
-        # Render it out as flat HTML
-        obj.content = obj.rendered_content
+            # Pull in the content as is
+            obj.content = post.content
+
+            # Render it out as flat HTML
+            obj.content = obj.rendered_content
 
         # Make sure the page has recommended metadata
         # ... if it's ready to publish
@@ -177,57 +268,122 @@ class BaseBigBuildFrontmatterDeserializer(object):
         # Pass it back out
         return obj
 
+    def set_data_objects(self, obj):
+        """
+        Loads the data files listed in the frontmatter into the provided bigbuild model object.
+        """
+        obj.set_data_objects()
+
 
 class PageFrontmatterDeserializer(BaseBigBuildFrontmatterDeserializer):
     """
     Deserializes Jekyll frontmatter from YAML to a bigbuild Page object.
     """
+    cache = caches.FileCache('pages')
+
     def __init__(self):
         self.model = apps.get_app_config('bigbuild').get_model('Page')
 
-    def set_metadata(self, obj):
-        """
-        Extends the base deserialization with techniques for syncing data files.
-        """
-        obj = super(PageFrontmatterDeserializer, self).set_metadata(obj)
-
-        # Reopen the YAML frontmatter
-        stream = open(obj.frontmatter_path, 'r')
-        post = frontmatter.load(stream)
-
-        # Loop through any data files
-        for key, path in post.metadata.get('data', {}).items():
-
-            # Generate the path if it's stored in the default `data` directory
-            data_dir = os.path.join(obj.page_directory_path, 'data')
-            p = os.path.join(data_dir, path)
-            # If it doesn't exist, see if it's in another folder
-            if not os.path.exists(p):
-                p = os.path.join(obj.page_directory_path, path)
-                # If it's not there either, throw an error
-                if not os.path.exists(p):
-                    logging.debug("Data file could not be found at %s" % p)
-
-            # Open the file
-            with codecs.open(p, 'r') as f:
-                # If it's a CSV file open it that way...
-                if p.endswith(".csv"):
-                    obj.data_objects[key] = list(csv.DictReader(f))
-                # If it's a JSON file open it this way ...
-                elif p.endswith(".json"):
-                    obj.data_objects[key] = json.load(f)
-                # If it's a YAML file open it t'other way ...
-                elif (p.endswith(".yml") or p.endswith(".yaml")):
-                    obj.data_objects[key] = yaml.load(f)
-                elif p.endswith(".aml"):
-                    obj.data_objects[key] = archieml.load(f)
-                # If it's none of those throw an error.
-                else:
-                    logging.debug("Data file at %s not recognizable type" % path)
+    def deserialize(self, slug, metadata_only=False):
+        """
+        Extends the base deserialization with a persistent cache of unchanged pages.
 
-        # Pass it back out
+        Only used when the BIGBUILD_PAGE_CACHE setting is True.
+        """
+        if not getattr(settings, 'BIGBUILD_PAGE_CACHE', False):
+            return super(PageFrontmatterDeserializer, self).deserialize(slug, metadata_only=metadata_only)
+
+        # Check for an entry that matches the files on disk
+        page_directory_path = os.path.join(bigbuild.get_page_directory(), slug)
+        key = caches.make_key(page_directory_path, metadata_only)
+        entry = self.cache.get(key)
+        if entry and self.is_current(key, entry, page_directory_path):
+            logger.debug("Retrieving {} from the page cache".format(slug))
+            return entry['page']
+
+        # If there isn't one, load the page and save it for next time
+        obj = super(PageFrontmatterDeserializer, self).deserialize(slug, metadata_only=metadata_only)
+        # Pages loaded for their metadata alone don't read their data files, so they don't depend on them
+        dependencies = None if metadata_only else obj.get_data_paths()
+        paths = self.get_paths(page_directory_path, dependencies)
+        self.cache.set(key, dict(
+            stat_fingerprint=self.get_stat_fingerprint(paths),
+            fingerprint=self.get_fingerprint(paths, page_directory_path),
+            dependencies=dependencies,
+            page=obj
+        ))
         return obj
 
+    def is_current(self, key, entry, page_directory_path):
+        """
+        Tests if the provided cache entry still matches the files on disk.
+
+        The files are only read and hashed when their names, sizes or modification times have changed
+        since the entry was saved. If their contents turn out to be the same, the entry is updated
+        so they aren't hashed again next time.
+
+        Returns True or False.
+        """
+        paths = self.get_paths(page_directory_path, entry['dependencies'])
+        stat_fingerprint = self.get_stat_fingerprint(paths)
+        if entry.get('stat_fingerprint') == stat_fingerprint:
+            return True
+        if entry['fingerprint'] != self.get_fingerprint(paths, page_directory_path):
+            return False
+        entry['stat_fingerprint'] = stat_fingerprint
+        self.cache.set(key, entry)
+        return True
+
+    def get_paths(self, page_directory_path, dependencies=None):
+        """
+        Returns the files that go into deserializing the page in the provided directory.
+
+        That's metadata.md and index.html, plus everything in data/ and the provided data files
+        stored elsewhere if the page's data is loaded.
+        """
+        paths = [
+            os.path.join(page_directory_path, 'metadata.md'),
+            os.path.join(page_directory_path, 'index.html'),
+        ]
+        if dependencies is not None:
+            paths.append(os.path.join(page_directory_path, 'data'))
+            paths.extend(dependencies)
+        return paths
+
+    def get_stat_fingerprint(self, paths):
+        """
+        Returns a quick fingerprint of the names, sizes and modification times of the provided files,
+        along with the environment the page content is rendered in.
+        """
+        return caches.make_key(
+            bigbuild.__version__,
+            bigbuild.get_base_url(),
+            bigbuild.get_repo_branch(),
+            caches.get_fingerprint(*paths)
+        )
+
+    def get_fingerprint(self, paths, page_directory_path):
+        """
+        Returns a fingerprint of the contents of the provided files,
+        along with the environment the page content is rendered in.
+        """
+        return caches.make_key(
+            bigbuild.__version__,
+            bigbuild.get_base_url(),
+            bigbuild.get_repo_branch(),
+            caches.get_content_fingerprint(paths, page_directory_path)
+        )
+
+    def set_data_objects(self, obj):
+        """
+        Extends the base data loading to require that every data file exists.
+        """
+        for key, value in obj.data.items():
+            path = get_data_options(value)[0]
+            if not obj.get_data_path(path):
+                raise IOError("Data file {} could not be found at {}".format(key, path))
+        super(PageFrontmatterDeserializer, self).set_data_objects(obj)
+
 
 class ArchivedPageFrontmatterDeserializer(BaseBigBuildFrontmatterDeserializer):
     """
@@ -16,7 +16,7 @@ class SitemapView(BuildableListView):
         return reverse('bigbuild-sitemap').lstrip("/")
 
     def get_queryset(self):
-        return [p for p in PageList() if p.show_in_feeds]
+        return [p for p in PageList.snapshot() if p.show_in_feeds]
 
     def render_to_response(self, context):
         return super(SitemapView, self).render_to_response(
@@ -36,4 +36,4 @@ class GoogleNewsSitemapView(SitemapView):
         return reverse('bigbuild-google-news-sitemap').lstrip("/")
 
     def get_queryset(self):
-        return [p for p in PageList() if p.show_in_feeds][:25]
+        return [p for p in PageList.snapshot() if p.show_in_feeds][:25]
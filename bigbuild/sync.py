@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tools for mirroring page directories into the build directory without recopying unchanged files.
+"""
+import os
+import shutil
+import logging
+from bigbuild.caches import get_file_hash
+logger = logging.getLogger(__name__)
+
+
+def is_same_file(source_path, target_path, use_hash=False):
+    """
+    Tests if the target file already matches the source file.
+
+    Files match if they are the same file, or if they have the same size and modification time.
+    If use_hash is True, files of the same size with different modification times have their contents compared.
+
+    Returns True or False.
+    """
+    try:
+        target_stat = os.stat(target_path)
+    except OSError:
+        return False
+    source_stat = os.stat(source_path)
+
+    # Hardlinks to the source are always a match
+    if (source_stat.st_dev, source_stat.st_ino) == (target_stat.st_dev, target_stat.st_ino):
+        return True
+    if source_stat.st_size != target_stat.st_size:
+        return False
+    if abs(source_stat.st_mtime - target_stat.st_mtime) < 0.001:
+        return True
+    if use_hash and get_file_hash(source_path) == get_file_hash(target_path):
+        # Line up the timestamps so next time we don't have to hash it again
+        shutil.copystat(source_path, target_path)
+        return True
+    return False
+
+
+def copy_file(source_path, target_path, hardlink=False):
+    """
+    Copies the source file to the target path, keeping its modification time.
+
+    If hardlink is True and the two paths are on the same filesystem, the target is linked to the source instead.
+    Otherwise os.copy_file_range is used where it's available, so the kernel can copy without reading
+    the data into Python.
+    """
+    # Clear out whatever is there first, so we never write through an old hardlink into a source file
+    if os.path.isdir(target_path) and not os.path.islink(target_path):
+        shutil.rmtree(target_path)
+    elif os.path.lexists(target_path):
+        os.remove(target_path)
+
+    same_device = os.stat(source_path).st_dev == os.stat(os.path.dirname(target_path)).st_dev
+    if hardlink and same_device:
+        try:
+            os.link(source_path, target_path)
+            return
+        except OSError:
+            # Some filesystems don't support links, so fall back to a copy
+            pass
+
+    if same_device and hasattr(os, 'copy_file_range'):
+        with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+            remaining = os.fstat(source.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(source.fileno(), target.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+    else:
+        shutil.copyfile(source_path, target_path)
+    shutil.copystat(source_path, target_path)
+
+
+def sync_directory(source_dir, target_dir, use_hash=False, hardlink=False):
+    """
+    Mirrors the source directory into the target directory.
+
+    Files that already match are skipped, and files that no longer exist in the source are removed from the target.
+
+    Returns the number of files that were copied.
+    """
+    copied = 0
+    source_files = set()
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        rel_dir = os.path.relpath(dirpath, source_dir)
+        target_subdir = os.path.normpath(os.path.join(target_dir, rel_dir))
+        if not os.path.isdir(target_subdir):
+            if os.path.lexists(target_subdir):
+                os.remove(target_subdir)
+            os.makedirs(target_subdir)
+
+        for f in filenames:
+            source_path = os.path.join(dirpath, f)
+            target_path = os.path.join(target_subdir, f)
+            source_files.add(os.path.normpath(os.path.join(rel_dir, f)))
+            if is_same_file(source_path, target_path, use_hash=use_hash):
+                continue
+            logger.debug("Syncing {} to {}".format(source_path, target_path))
+            copy_file(source_path, target_path, hardlink=hardlink)
+            copied += 1
+
+    # Remove anything left over from files deleted in the source
+    for dirpath, dirnames, filenames in os.walk(target_dir, topdown=False):
+        rel_dir = os.path.relpath(dirpath, target_dir)
+        for f in filenames:
+            if os.path.normpath(os.path.join(rel_dir, f)) not in source_files:
+                logger.debug("Removing {}".format(os.path.join(dirpath, f)))
+                os.remove(os.path.join(dirpath, f))
+        if not os.path.isdir(os.path.join(source_dir, rel_dir)) and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+    logger.debug("Synced {} files from {} to {}".format(copied, source_dir, target_dir))
+    return copied
@@ -13,6 +13,7 @@ TEMP_DIR = tempfile.mkdtemp()
 BUILD_DIR = os.path.join(TEMP_DIR, '.build')
 BIGBUILD_PAGE_DIR = os.path.join(TEMP_DIR, '.pages')
 BIGBUILD_ARCHIVE_DIR = os.path.join(TEMP_DIR, '.archive')
+BIGBUILD_CACHE_DIR = os.path.join(TEMP_DIR, '.cache')
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -26,6 +27,7 @@ TEMPLATES = [
 
 
 @override_settings(BIGBUILD_ARCHIVE_DIR=BIGBUILD_ARCHIVE_DIR)
+@override_settings(BIGBUILD_CACHE_DIR=BIGBUILD_CACHE_DIR)
 @override_settings(BUILD_DIR=BUILD_DIR)
 @override_settings(BIGBUILD_PAGE_DIR=BIGBUILD_PAGE_DIR)
 @override_settings(TEMPLATES=TEMPLATES)
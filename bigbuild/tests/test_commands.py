@@ -1,18 +1,50 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import sys
+import time
 import logging
+import tempfile
+import subprocess
 import bigbuild
 from bigbuild.tests import TestBase
 from bigbuild.tests import BUILD_DIR
+from bigbuild.exceptions import BuildError
 from django.test import override_settings
 from bigbuild.models import PageList, Page
 from bigbuild import get_archive_directory
 from django.core.management import call_command
 from django.core.management.base import CommandError
+from django.core.serializers.base import DeserializationError
+from bigbuild.management.commands.build import Command as BuildCommand
+from bigbuild.management.commands.compresspages import Command as CompressPagesCommand
 logging.disable(logging.CRITICAL)
 
 
+# Starts up Django with bigbuild in a fresh interpreter and checks nothing slow happened along the way
+IMPORT_SCRIPT = """
+import sys
+import tempfile
+from django.conf import settings
+temp_dir = tempfile.mkdtemp()
+settings.configure(
+    INSTALLED_APPS=['django.contrib.staticfiles', 'compressor', 'compressor_toolkit', 'bakery', 'bigbuild'],
+    BASE_DIR=temp_dir,
+    STATIC_ROOT=temp_dir,
+    STATIC_URL='/static/',
+    TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates'}],
+)
+import django
+django.setup()
+import bigbuild.precompilers
+assert 'git' not in sys.modules, 'GitPython was imported'
+assert 'django.test' not in sys.modules, 'django.test was imported'
+import bigbuild.views
+from bigbuild.models import PageList
+assert PageList._snapshot is None, 'The pages were loaded'
+"""
+
+
 class TestCommands(TestBase):
 
     def test_build(self):
@@ -30,12 +62,164 @@ class TestCommands(TestBase):
         with override_settings(BUILD_DIR=''):
             bigbuild.get_build_directory()
 
+    def test_incremental_build(self):
+        p = Page.create(slug="test-incremental-page", force=True)
+        call_command(BuildCommand())
+        index_path = os.path.join(p.build_directory_path, 'index.html')
+
+        # Mark the built file so we can tell if it gets rebuilt
+        with open(index_path, 'a') as f:
+            f.write('<!-- untouched -->')
+
+        # An unchanged page should be skipped
+        call_command(BuildCommand(), incremental=True)
+        self.assertIn('untouched', open(index_path).read())
+
+        # A changed page should be rebuilt
+        p.headline = 'Changed'
+        p.write_frontmatter()
+        call_command(BuildCommand(), incremental=True)
+        self.assertNotIn('untouched', open(index_path).read())
+
+        # So should a page whose data file outside its directory has changed
+        data_path = os.path.join(tempfile.mkdtemp(), 'shared.json')
+        with open(data_path, 'w') as f:
+            f.write('[]')
+        p.data = {'shared': data_path}
+        p.write_frontmatter()
+        call_command(BuildCommand(), incremental=True)
+        with open(index_path, 'a') as f:
+            f.write('<!-- untouched -->')
+        call_command(BuildCommand(), incremental=True)
+        self.assertIn('untouched', open(index_path).read())
+        with open(data_path, 'w') as f:
+            f.write('[{"key": "value"}]')
+        call_command(BuildCommand(), incremental=True)
+        self.assertNotIn('untouched', open(index_path).read())
+
+        # A deleted page should be removed
+        p.delete()
+        call_command(BuildCommand(), incremental=True)
+        self.assertFalse(os.path.exists(p.build_directory_path))
+
+    def test_pooled_build(self):
+        call_command(BuildCommand(), workers=2)
+        expected_index = os.path.join(
+            PageList()['a-live-page'].build_directory_path,
+            'index.html'
+        )
+        self.assertTrue(os.path.exists(expected_index))
+
+        # Failures should be collected with their slug
+        p = Page.create(slug="test-pooled-broken-page", force=True)
+        with open(os.path.join(p.page_directory_path, 'index.html'), 'w') as f:
+            f.write('{% broken %}')
+        with self.assertRaisesRegexp(BuildError, 'test-pooled-broken-page'):
+            call_command(BuildCommand(), workers=2)
+        p.delete()
+
+    def test_compresspages(self):
+        """
+        Test compressing every page's bundles ahead of the build
+        """
+        from compressor.cache import cache
+        from bigbuild.views import PageDetailView
+        from bigbuild.manifests import CompressManifest
+        from django.template import Engine
+        from bigbuild.compressors import BundleCollector, collect_bundles, get_bundle_key, set_offline_bundles
+
+        shared_block = '<script>var  shared  =  1;</script>'
+        page_list = [
+            Page.create(slug="test-compress-page", force=True),
+            Page.create(slug="test-second-compress-page", force=True)
+        ]
+        for p in page_list:
+            with open(os.path.join(p.page_directory_path, 'index.html'), 'w') as f:
+                f.write(
+                    '{% load compress %}'
+                    '{% compress js inline %}' + shared_block + '{% endcompress %}'
+                    '{% compress js inline %}<script src="{{ STATIC_URL }}app.js"></script>{% endcompress %}'
+                )
+            with open(os.path.join(p.page_directory_path, 'static', 'app.js'), 'w') as f:
+                f.write("var  slug  =  '{{ object.slug }}';")
+
+        def render(p):
+            view = PageDetailView()
+            view.request = view.create_request(view.get_url(p))
+            view.set_kwargs(p)
+            return view.get_content().decode("utf-8")
+
+        try:
+            # The bundle the pages share is compressed once
+            call_command(CompressPagesCommand(), workers=2)
+            bundles = CompressManifest().read()
+            shared_key = get_bundle_key('js', 'inline', shared_block)
+            self.assertTrue('var shared=1' in bundles[shared_key]['output'])
+            self.assertEqual(len([b for b in bundles.values() if 'object' in b['context']]), 2)
+
+            # And the pages read it from the manifest
+            bundles[shared_key] = dict(output='<script>from the manifest</script>', context={})
+            set_offline_bundles(bundles)
+            html = render(page_list[0])
+            self.assertTrue('from the manifest' in html)
+
+            # Bundles that depend on values that differ from page to page are compressed during the render
+            self.assertTrue("var slug='test-compress-page'" in html)
+            self.assertTrue("var slug='test-second-compress-page'" in render(page_list[1]))
+
+            # Only the compress blocks are rendered to find the bundles, not the rest of the page
+            template = Engine.get_default().from_string(
+                '{% load compress %}{% url "not-a-view" %}'
+                '{% compress js inline %}<script>var  a;</script>{% endcompress %}'
+            )
+            with BundleCollector() as collector:
+                collect_bundles(template)
+            self.assertEqual(list(collector.jobs.keys()), [get_bundle_key('js', 'inline', '<script>var  a;</script>')])
+
+            # The build can run it first
+            call_command(BuildCommand(), compress=True)
+        finally:
+            set_offline_bundles(None)
+            cache.clear()
+            [p.delete() for p in page_list]
+
     @override_settings(BIGBUILD_GIT_BRANCH='test', BIGBUILD_BRANCH_BUILD=True)
     def test_branch_build(self):
         call_command("build")
         self.assertTrue(os.path.exists(os.path.join(BUILD_DIR, 'test')))
         self.assertTrue('test' in bigbuild.get_base_url())
 
+    def test_import_time(self):
+        """
+        Test that importing bigbuild doesn't load the pages or any slow dependencies
+        """
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.check_call([sys.executable, '-c', IMPORT_SCRIPT], env=env)
+
+    def test_repo_branch(self):
+        repo_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(repo_dir, '.git'))
+        head_path = os.path.join(repo_dir, '.git', 'HEAD')
+        with open(head_path, 'w') as f:
+            f.write('ref: refs/heads/master\n')
+
+        with override_settings(BIGBUILD_GIT_BRANCH=None, BIGBUILD_GIT_DIR=repo_dir):
+            # The branch is read from HEAD
+            self.assertEqual(bigbuild.get_repo_branch(), 'master')
+
+            # And read again when it changes
+            with open(head_path, 'w') as f:
+                f.write('ref: refs/heads/feature/test-branch\n')
+            os.utime(head_path, (0, 0))
+            self.assertEqual(bigbuild.get_repo_branch(), 'feature/test-branch')
+
+        # Worktrees point to their git directory with a file
+        worktree_dir = tempfile.mkdtemp()
+        with open(os.path.join(worktree_dir, '.git'), 'w') as f:
+            f.write('gitdir: {}\n'.format(os.path.join(repo_dir, '.git')))
+        with override_settings(BIGBUILD_GIT_BRANCH=None, BIGBUILD_GIT_DIR=worktree_dir):
+            self.assertEqual(bigbuild.get_repo_branch(), 'feature/test-branch')
+
     @override_settings(BIGBUILD_BRANCH_BUILD=False)
     def test_base_url(self):
         bigbuild.get_base_url()
@@ -47,6 +231,16 @@ class TestCommands(TestBase):
     def test_validatepages(self):
         call_command("validatepages")
 
+        # Data files the content doesn't use are still checked
+        p = Page.create(slug="test-validate-broken-data", force=True)
+        p.data = {"foo": "static/bar.json"}
+        p.write_frontmatter()
+        with open(os.path.join(p.page_directory_path, 'static', 'bar.json'), 'w') as f:
+            f.write('{"rows": [')
+        with self.assertRaisesRegexp(DeserializationError, 'bar.json'):
+            call_command("validatepages")
+        p.delete()
+
     def test_createpage(self):
         call_command("createpage", "test-page")
         with self.assertRaises(ValueError):
@@ -74,3 +268,56 @@ class TestCommands(TestBase):
         after = PageList()
         self.assertEqual(before[0].slug, after[0].slug)
         call_command("cachepages")
+
+    def test_cache_directory(self):
+        """
+        Test several workers making the cache directory at once
+        """
+        from multiprocessing.pool import ThreadPool
+        cache_dir = os.path.join(tempfile.mkdtemp(), 'cache')
+        with override_settings(BIGBUILD_CACHE_DIR=cache_dir):
+            pool = ThreadPool(processes=8)
+            try:
+                paths = pool.map(lambda i: bigbuild.get_cache_directory(), range(32))
+            finally:
+                pool.close()
+                pool.join()
+        self.assertEqual(set(paths), set([cache_dir]))
+        self.assertTrue(os.path.isdir(cache_dir))
+
+    def test_prunecache(self):
+        """
+        Test pruning the caches
+        """
+        from bigbuild.caches import FileCache, make_key
+        call_command("build")
+        manifest_dir = os.path.join(bigbuild.get_cache_directory(), 'manifests')
+        self.assertTrue(os.listdir(manifest_dir))
+
+        # Make one entry that was last used two months ago and one that was just used
+        cache = FileCache('test')
+        stale_key, fresh_key = make_key('stale'), make_key('fresh')
+        cache.set(stale_key, 'stale')
+        cache.set(fresh_key, 'fresh')
+        two_months_ago = time.time() - 60 * 24 * 60 * 60
+        os.utime(cache.get_path(stale_key), (two_months_ago, two_months_ago))
+
+        # By default only entries that haven't been used in 30 days are removed
+        call_command("prunecache")
+        self.assertFalse(os.path.exists(cache.get_path(stale_key)))
+        self.assertEqual(cache.get(fresh_key), 'fresh')
+
+        # Unless you say otherwise
+        call_command("prunecache", "--days=90")
+        self.assertEqual(cache.get(fresh_key), 'fresh')
+        call_command("prunecache", "--all")
+        self.assertEqual(cache.get(fresh_key), None)
+
+        # The build manifests are left alone either way
+        self.assertTrue(os.listdir(manifest_dir))
+
+    def test_benchmarkfrontmatter(self):
+        """
+        Test the frontmatter benchmark
+        """
+        call_command("benchmarkfrontmatter", "--count=5", "--parser=bigbuild.serializers.FastFrontmatterParser")
@@ -2,9 +2,14 @@
 # -*- coding: utf-8 -*-
 import os
 import logging
+import tempfile
 from bigbuild.tests import TestBase
 from bigbuild.models import PageList
+from six.moves import cPickle as pickle
+from bigbuild.data import CompactCSV, DataLoader, LazyDataObjects, PARSERS, load_yaml
+from django.test import override_settings
 from django.core.management import call_command
+from django.core.serializers.base import DeserializationError
 logging.disable(logging.CRITICAL)
 
 
@@ -129,3 +134,201 @@ class TestData(TestBase):
         call_command("unarchivepage", p.slug)
 
         p.delete()
+
+    def test_missing(self):
+        # Create an object
+        call_command("createpage", 'test-missing-data')
+        p = PageList()['test-missing-data']
+
+        # Point it at a data file that doesn't exist
+        p.data = {"foo": "static/bar.csv"}
+        p.write_frontmatter()
+
+        # Make sure it won't load
+        with self.assertRaises(DeserializationError):
+            p.refresh_from_yaml()
+
+        p.delete()
+
+    def test_loader(self):
+        loader = DataLoader()
+        data_dir = tempfile.mkdtemp()
+        csv_path = os.path.join(data_dir, 'foo.csv')
+        with open(csv_path, 'w') as f:
+            f.write('key,bar\nvalue,value')
+        json_path = os.path.join(data_dir, 'foo.json')
+        with open(json_path, 'w') as f:
+            f.write('[{"key": "value"}]')
+
+        # The first load parses the file and the second comes from the cache
+        first = loader.load(csv_path)
+        self.assertEqual(first[0]['key'], 'value')
+        self.assertTrue(loader.load(csv_path) is first)
+        self.assertEqual((loader.hits, loader.misses), (1, 1))
+
+        # Changing the file busts the cache
+        with open(csv_path, 'w') as f:
+            f.write('key,bar\nnew,value')
+        self.assertEqual(loader.load(csv_path)[0]['key'], 'new')
+        self.assertEqual(loader.misses, 2)
+
+        # Going over the budget evicts the least recently used file
+        with override_settings(BIGBUILD_DATA_CACHE_SIZE=os.path.getsize(json_path)):
+            loader.load(json_path)
+            self.assertEqual(len(loader.entries), 1)
+            loader.load(csv_path)
+            self.assertEqual(loader.misses, 4)
+
+        # Files we don't know how to read are an error
+        with self.assertRaises(DeserializationError):
+            loader.load(os.path.join(data_dir, 'foo.txt'))
+
+    def test_shared(self):
+        data_dir = tempfile.mkdtemp()
+        json_path = os.path.join(data_dir, 'foo.json')
+        with open(json_path, 'w') as f:
+            f.write('[{"key": "value"}]')
+
+        # Pages that use the same file are handed the same objects, rather than copies,
+        # which is why they have to be treated as read only
+        first = LazyDataObjects({'foo': json_path})
+        second = LazyDataObjects({'bar': json_path})
+        self.assertTrue(first['foo'] is second['bar'])
+
+        # Until the file changes
+        with open(json_path, 'w') as f:
+            f.write('[{"key": "new value"}]')
+        third = LazyDataObjects({'foo': json_path})
+        self.assertFalse(third['foo'] is first['foo'])
+        self.assertEqual(third['foo'][0]['key'], 'new value')
+
+    def test_lazy(self):
+        data_dir = tempfile.mkdtemp()
+        json_path = os.path.join(data_dir, 'foo.json')
+        with open(json_path, 'w') as f:
+            f.write('[{"key": "value"}]')
+        data_objects = LazyDataObjects({'foo': json_path, 'bar': os.path.join(data_dir, 'bar.json')})
+
+        # Nothing is parsed until it's asked for
+        self.assertEqual(sorted(data_objects.keys()), ['bar', 'foo'])
+        self.assertEqual(data_objects.loaded, {})
+        self.assertEqual(data_objects['foo'][0]['key'], 'value')
+        self.assertEqual(list(data_objects.loaded.keys()), ['foo'])
+
+        # And parsed data isn't pickled
+        self.assertEqual(pickle.loads(pickle.dumps(data_objects)).loaded, {})
+
+    def test_broken_data(self):
+        call_command("createpage", 'test-broken-data')
+        p = PageList()['test-broken-data']
+        p.data = {"foo": "static/bar.json"}
+        p.write_frontmatter()
+        with open(os.path.join(p.page_directory_path, 'static', 'bar.json'), 'w+') as f:
+            f.write('{"rows": [')
+        p.refresh_from_yaml()
+
+        # A file that can't be parsed fails the render, rather than leaving a blank
+        with self.assertRaisesRegexp(DeserializationError, 'bar.json'):
+            p.render_content(u"{{ object.data.foo.rows }}")
+
+        p.delete()
+
+    def test_metadata_only(self):
+        call_command("createpage", 'test-metadata-only-data')
+        p = PageList()['test-metadata-only-data']
+        p.data = {"foo": "static/bar.json"}
+        p.content = u"{{ object.data.foo.key }}"
+        p.write_frontmatter()
+        with open(os.path.join(p.page_directory_path, 'static', 'bar.json'), 'w+') as f:
+            f.write('{"key": "value"}')
+
+        # Pages loaded for their metadata alone still pull in their data when the content is rendered
+        for obj in [
+            PageList()['test-metadata-only-data'],
+            PageList.get_page_by_slug('test-metadata-only-data', metadata_only=True)
+        ]:
+            self.assertEqual(obj.content.strip(), 'value')
+
+        # Including ones that come out of the page cache
+        with override_settings(BIGBUILD_PAGE_CACHE=True):
+            for i in range(2):
+                obj = PageList.get_page_by_slug('test-metadata-only-data', metadata_only=True)
+                self.assertEqual(obj.content.strip(), 'value')
+
+        p.delete()
+
+    def test_empty_data(self):
+        call_command("createpage", 'test-empty-data')
+        p = PageList()['test-empty-data']
+
+        # Pages whose data files are all skipped only map them out once
+        p.data = {"foo": "static/bar.txt"}
+        p.data_objects = None
+        data_objects = p.load_data_objects()
+        self.assertEqual(data_objects, {})
+        self.assertTrue(p.load_data_objects() is data_objects)
+
+        p.delete()
+
+    def test_compact_csv(self):
+        # Create an object
+        call_command("createpage", 'test-compact-csv')
+        p = PageList()['test-compact-csv']
+
+        # Point it at a CSV with typed columns
+        p.data = {"foo": {"path": "static/bar.csv", "compact": True, "types": {"votes": "int", "pct": "float"}}}
+        p.write_frontmatter()
+        static_path = os.path.join(p.page_directory_path, 'static')
+        with open(os.path.join(static_path, 'bar.csv'), 'w+') as f:
+            f.write('name,votes,pct\nfoo,10,0.5\nbar,20,\n')
+
+        # Resync the object so that it opens the data file
+        p.refresh_from_yaml()
+
+        # It should act like a list of dicts
+        rows = p.data_objects['foo']
+        self.assertTrue(isinstance(rows, CompactCSV))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0], {'name': 'foo', 'votes': 10, 'pct': 0.5})
+        self.assertEqual(list(rows)[-1], {'name': 'bar', 'votes': 20, 'pct': None})
+        self.assertEqual(rows[-1:], [rows[1]])
+
+        # With the columns stored in arrays where they can be
+        self.assertEqual(list(rows.column('votes')), [10, 20])
+        self.assertEqual(rows.column('pct'), [0.5, None])
+
+        # Bad types, missing columns and values that won't convert fail the render, naming the file and column
+        for types in [{"votes": "date"}, {"turnout": "int"}, {"name": "int"}]:
+            p.data = {"foo": {"path": "static/bar.csv", "compact": True, "types": types}}
+            p.write_frontmatter()
+            p.refresh_from_yaml()
+            column = list(types.keys())[0]
+            with self.assertRaisesRegexp(DeserializationError, r'Column {} in .*bar\.csv'.format(column)):
+                p.render_content(u"{% for row in object.data.foo %}{{ row.name }}{% endfor %}")
+
+        p.delete()
+
+    def test_persistent_cache(self):
+        data_dir = tempfile.mkdtemp()
+        yaml_path = os.path.join(data_dir, 'foo.yaml')
+        with open(yaml_path, 'w') as f:
+            f.write('- key: value')
+
+        # The first load parses the file and saves it
+        first = DataLoader().load(yaml_path)
+        self.assertEqual(first[0]['key'], 'value')
+
+        # A fresh loader, like a new process would have, reads it back from the cache
+        # rather than parsing it again
+        PARSERS['.yaml'] = lambda f: 'parsed'
+        try:
+            self.assertEqual(DataLoader().load(yaml_path), first)
+            # Unless the setting is off
+            with override_settings(BIGBUILD_DATA_CACHE=False):
+                self.assertEqual(DataLoader().load(yaml_path), 'parsed')
+        finally:
+            PARSERS['.yaml'] = load_yaml
+
+        # And pruning clears it out
+        self.assertTrue(DataLoader.cache.prune(max_age=60 * 60) == 0)
+        self.assertTrue(DataLoader.cache.prune() > 0)
@@ -1,12 +1,18 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import os
+import six
+import time
 import logging
+import bigbuild
 from bigbuild import exceptions
 from bigbuild.tests import TestBase
+from datetime import timedelta
+from django.utils import timezone
 from django.test import override_settings
 from bigbuild.views import PageDetailView
 from bigbuild.models import PageList, Page
+from bigbuild.serializers import deserializers, FrontmatterParser, FastFrontmatterParser
 from django.core.serializers.base import DeserializationError
 logging.disable(logging.CRITICAL)
 
@@ -49,6 +55,144 @@ class TestModels(TestBase):
         with self.assertRaises(IndexError):
             page_list[100]
 
+    def test_pagelist_snapshot(self):
+        # The snapshot should be reused until the filesystem changes
+        snapshot = PageList.snapshot()
+        self.assertIs(snapshot, PageList.snapshot())
+        with self.assertRaises(KeyError):
+            snapshot['test-snapshot']
+
+        # Adding a page should trigger a reload
+        p = Page.create(slug='test-snapshot', force=True)
+        self.assertIsNot(snapshot, PageList.snapshot())
+        self.assertEqual(PageList.snapshot()['test-snapshot'].slug, p.slug)
+
+        # And so should editing its metadata
+        p.headline = 'Changed'
+        p.write_frontmatter()
+        self.assertEqual(PageList.snapshot()['test-snapshot'].headline, 'Changed')
+
+        # And so should clearing it
+        snapshot = PageList.snapshot()
+        PageList.clear_snapshot()
+        self.assertIsNot(snapshot, PageList.snapshot())
+        p.delete()
+
+        # And so should a pending page going live, even though nothing on the filesystem changed
+        with override_settings(BIGBUILD_PAGE_PUBLICATION_STATUS='live'):
+            pub_date = timezone.make_naive(timezone.now()) + timedelta(seconds=1)
+            pending = Page.create(slug='test-snapshot-pending', published=True, pub_date=pub_date, force=True)
+            with self.assertRaises(KeyError):
+                PageList.snapshot()['test-snapshot-pending']
+            time.sleep(1.1)
+            self.assertEqual(PageList.snapshot()['test-snapshot-pending'].slug, pending.slug)
+        pending.delete()
+
+    def test_get_page_by_slug(self):
+        p = PageList.get_page_by_slug('a-live-page')
+        self.assertIsInstance(p, Page)
+        self.assertEqual(p.slug, PageList()['a-live-page'].slug)
+        with self.assertRaises(KeyError):
+            PageList.get_page_by_slug('foobar')
+        with self.assertRaises(KeyError):
+            PageList.get_page_by_slug('.DS_Store')
+
+    def test_metadata_only(self):
+        p = Page.create(slug='test-metadata-only', content='{{ object.slug }}', force=True)
+
+        # The content should not be rendered until it is accessed
+        lazy = PageList()['test-metadata-only']
+        self.assertIn('content', lazy.get_deferred_fields())
+        self.assertEqual(lazy.content, p.slug)
+        self.assertNotIn('content', lazy.get_deferred_fields())
+
+        # Unless everything is loaded up front
+        eager = PageList(metadata_only=False)['test-metadata-only']
+        self.assertEqual(eager.get_deferred_fields(), set())
+        self.assertEqual(eager.content, p.slug)
+        p.delete()
+
+    def test_pagelist_workers(self):
+        serial = PageList()
+        with override_settings(BIGBUILD_LOAD_WORKERS=2):
+            pooled = PageList()
+        self.assertEqual([p.slug for p in serial], [p.slug for p in pooled])
+
+        # Errors should name the slug
+        p = Page.create(slug='test-pooled-no-yaml')
+        os.remove(p.frontmatter_path)
+        with override_settings(BIGBUILD_LOAD_WORKERS=2):
+            with self.assertRaisesRegexp(DeserializationError, 'test-pooled-no-yaml'):
+                PageList()
+        p.delete()
+
+    @override_settings(BIGBUILD_PAGE_CACHE=True)
+    def test_page_cache(self):
+        p = Page.create(slug='test-page-cache', headline='Foo', force=True)
+
+        # The first load should be saved to the cache
+        self.assertEqual(PageList()['test-page-cache'].headline, 'Foo')
+        cache_dir = os.path.join(bigbuild.get_cache_directory(), 'pages')
+        self.assertTrue(os.listdir(cache_dir))
+
+        # And the second pulled from it without parsing the frontmatter, or even hashing it
+        deserializer = deserializers['Page']()
+        deserializer.load_frontmatter = None
+        deserializer.get_fingerprint = None
+        self.assertEqual(deserializer.deserialize('test-page-cache', metadata_only=True).headline, 'Foo')
+
+        # Touching the files without changing them only hashes them once more
+        os.utime(p.frontmatter_path, None)
+        deserializer = deserializers['Page']()
+        deserializer.load_frontmatter = None
+        self.assertEqual(deserializer.deserialize('test-page-cache', metadata_only=True).headline, 'Foo')
+        deserializer.get_fingerprint = None
+        self.assertEqual(deserializer.deserialize('test-page-cache', metadata_only=True).headline, 'Foo')
+
+        # Pages loaded for their metadata alone don't depend on their data files
+        with open(os.path.join(p.page_directory_path, 'static', 'foo.json'), 'w') as f:
+            f.write('{"key": "value"}')
+        p.data = {'foo': 'static/foo.json'}
+        p.content = u"{{ object.data.foo.key }}"
+        p.write_frontmatter()
+        self.assertEqual(PageList()['test-page-cache'].data, {'foo': 'static/foo.json'})
+        self.assertEqual(PageList(metadata_only=False)['test-page-cache'].content.strip(), 'value')
+        with open(os.path.join(p.page_directory_path, 'static', 'foo.json'), 'w') as f:
+            f.write('{"key": "changed"}')
+        deserializer = deserializers['Page']()
+        deserializer.load_frontmatter = None
+        deserializer.get_fingerprint = None
+        deserializer.deserialize('test-page-cache', metadata_only=True)
+        # But fully loaded pages do
+        self.assertEqual(deserializers['Page']().deserialize('test-page-cache').content.strip(), 'changed')
+
+        # Until the metadata changes
+        p.headline = 'Bar'
+        p.write_frontmatter()
+        self.assertEqual(PageList()['test-page-cache'].headline, 'Bar')
+        self.assertEqual(PageList(metadata_only=False)['test-page-cache'].headline, 'Bar')
+        p.delete()
+
+    def test_frontmatter_parser(self):
+        # The fast parser should match python-frontmatter on every page
+        for obj in PageList():
+            with open(obj.frontmatter_path, 'r') as f:
+                expected = FrontmatterParser().load(f)
+            with open(obj.frontmatter_path, 'r') as f:
+                actual = FastFrontmatterParser().load(f)
+            self.assertEqual(actual.metadata, expected.metadata)
+            self.assertEqual(actual.content, expected.content)
+
+        # And hand off anything without a plain YAML header
+        self.assertEqual(FastFrontmatterParser().loads(u"No header here"), None)
+        self.assertEqual(FastFrontmatterParser().loads(u"---\nheadline: Unclosed"), None)
+        post = FastFrontmatterParser().load(six.StringIO(u"No header here"))
+        self.assertEqual((post.metadata, post.content), ({}, u"No header here"))
+
+        # The parser can be swapped out
+        with override_settings(BIGBUILD_FRONTMATTER_PARSER='bigbuild.serializers.FrontmatterParser'):
+            self.assertEqual(len(PageList(metadata_only=False)), len(PageList()))
+
     def test_sans(self):
         Page.create(slug='test-sans', published=True, index_template_context={'sans': True})
 
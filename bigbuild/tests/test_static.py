@@ -1,13 +1,45 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import os
+import sys
+import gzip
+import json
 import logging
+import tempfile
 from bigbuild.tests import TestBase
+from fs.osfs import OSFS
+from bigbuild.gzipper import Gzipper
+from bigbuild.models import PageList
+from bigbuild.views import PageDetailView
+from bigbuild.sync import sync_directory
+from multiprocessing.pool import ThreadPool
+from bigbuild.exceptions import CompilerError
+from bigbuild.workers import CompilerPool
+from django.template import Engine
 from django.test import override_settings
 from django.core.management import call_command
-from bigbuild.compressors import SimpleCompressor
+from bigbuild.rendering import template_cache
+from bigbuild.compressors import SimpleCompressor, SimpleJsCompressor
 from compressor.exceptions import UncompressableFileError
 logging.disable(logging.CRITICAL)
 
+# A compiler that stands in for node, upper-casing code and signing it with its process id
+STUB_COMPILER = """
+import os, sys, json
+for line in iter(sys.stdin.readline, ''):
+    job = json.loads(line)
+    if job['source'] == 'crash':
+        sys.exit(1)
+    elif job['source'] == 'paths':
+        result = {'id': job['id'], 'output': json.dumps(job['options']['paths'])}
+    elif job['source'] == 'error':
+        result = {'id': job['id'], 'error': 'Bad code'}
+    else:
+        result = {'id': job['id'], 'output': '{} {}'.format(os.getpid(), job['source'].upper())}
+    sys.stdout.write(json.dumps(result) + '\\n')
+    sys.stdout.flush()
+"""
+
 
 class TestStatic(TestBase):
 
@@ -25,3 +57,319 @@ class TestStatic(TestBase):
         """
         with override_settings(COMPRESS_ENABLED=False):
             call_command("build")
+
+    def test_sync(self):
+        """
+        Test syncing static directories
+        """
+        source_dir = tempfile.mkdtemp()
+        target_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(source_dir, 'img'))
+        with open(os.path.join(source_dir, 'app.js'), 'w') as f:
+            f.write('var foo;')
+        with open(os.path.join(source_dir, 'img', 'poster.jpg'), 'w') as f:
+            f.write('jpg')
+        with open(os.path.join(target_dir, 'old.js'), 'w') as f:
+            f.write('var old;')
+
+        # The first sync copies everything and removes what's not in the source
+        self.assertEqual(sync_directory(source_dir, target_dir), 2)
+        self.assertTrue(os.path.exists(os.path.join(target_dir, 'img', 'poster.jpg')))
+        self.assertFalse(os.path.exists(os.path.join(target_dir, 'old.js')))
+
+        # The second skips everything
+        self.assertEqual(sync_directory(source_dir, target_dir), 0)
+
+        # Unless something changes
+        with open(os.path.join(source_dir, 'app.js'), 'w') as f:
+            f.write('var foobar;')
+        self.assertEqual(sync_directory(source_dir, target_dir), 1)
+        with open(os.path.join(target_dir, 'app.js')) as f:
+            self.assertEqual(f.read(), 'var foobar;')
+
+        # Hashing spots identical files with new timestamps
+        os.utime(os.path.join(source_dir, 'app.js'), (0, 0))
+        self.assertEqual(sync_directory(source_dir, target_dir, use_hash=True), 0)
+
+        # And hardlinks should work too
+        os.remove(os.path.join(target_dir, 'app.js'))
+        self.assertEqual(sync_directory(source_dir, target_dir, hardlink=True), 1)
+        self.assertTrue(os.path.samefile(
+            os.path.join(source_dir, 'app.js'),
+            os.path.join(target_dir, 'app.js')
+        ))
+
+    def test_gzipper(self):
+        """
+        Test gzipping static directories
+        """
+        source_dir = tempfile.mkdtemp()
+        target_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(source_dir, 'img'))
+        with open(os.path.join(source_dir, 'app.js'), 'w') as f:
+            f.write('var foo;' * 100)
+        with open(os.path.join(source_dir, 'img', 'poster.jpg'), 'w') as f:
+            f.write('jpg')
+
+        gzipper = Gzipper(OSFS("/"))
+        gzipper.copytree_and_gzip(source_dir, target_dir)
+
+        # JavaScript is gzipped and images are copied as they are
+        with gzip.open(os.path.join(target_dir, 'app.js'), 'rb') as f:
+            self.assertEqual(f.read(), b'var foo;' * 100)
+        with open(os.path.join(target_dir, 'img', 'poster.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), b'jpg')
+        self.assertEqual(gzipper.file_count, 1)
+        self.assertTrue(gzipper.bytes_saved > 0)
+
+        # The second time around the output comes from the cache, byte for byte
+        with open(os.path.join(target_dir, 'app.js'), 'rb') as f:
+            first = f.read()
+        with override_settings(BIGBUILD_GZIP_WORKERS=1):
+            Gzipper(OSFS("/")).copytree_and_gzip(source_dir, target_dir)
+        with open(os.path.join(target_dir, 'app.js'), 'rb') as f:
+            self.assertEqual(f.read(), first)
+
+        # Builds spread across several processes split the threads between them
+        with override_settings(BIGBUILD_GZIP_WORKERS=8):
+            self.assertEqual(Gzipper(OSFS("/")).workers, 8)
+            self.assertEqual(Gzipper(OSFS("/"), processes=4).workers, 2)
+            self.assertEqual(Gzipper(OSFS("/"), processes=16).workers, 1)
+            self.assertEqual(PageDetailView(workers=4).get_gzipper().workers, 2)
+
+        # And the whole thing works in a build, pooled or not
+        with override_settings(BAKERY_GZIP=True):
+            call_command("build")
+            call_command("build", workers=2)
+
+    def test_es6_paths(self):
+        """
+        Test the ES6 precompiler only searches the page being compiled
+        """
+        from django.conf import settings
+        installed_apps = list(settings.INSTALLED_APPS) + ['compressor_toolkit']
+        with override_settings(INSTALLED_APPS=installed_apps):
+            from bigbuild.precompilers import ES6Compiler, get_all_static
+            obj = PageList()[0]
+            static_dir = os.path.join(obj.page_directory_path, 'static')
+
+            # Files in a page get that page's static directory and the shared directories
+            compiler = ES6Compiler(u'', filename=os.path.join(static_dir, 'app.js'))
+            options = dict(compiler.options)
+            self.assertEqual(options['paths'].split(os.pathsep), [static_dir, options['node_modules']])
+
+            # Inline code gets every page
+            compiler = ES6Compiler(u'')
+            self.assertEqual(len(dict(compiler.options)['paths'].split(os.pathsep)), len(get_all_static()) + 1)
+
+            # And options passed in still win out
+            compiler = ES6Compiler(u'', paths='/foo/')
+            self.assertEqual(dict(compiler.options)['paths'], '/foo/')
+
+    def test_asset_cache(self):
+        """
+        Test rendered static files are cached on their content and the context values they use
+        """
+        source_dir = tempfile.mkdtemp()
+        plain_path = os.path.join(source_dir, 'plain.css')
+        with open(plain_path, 'w') as f:
+            f.write('body { color: red; }')
+        template_path = os.path.join(source_dir, 'app.js')
+        with open(template_path, 'w') as f:
+            f.write('var url = "{{ STATIC_URL }}";')
+
+        # Files without template tags come back untouched
+        c = SimpleCompressor(context={'STATIC_URL': '/foo/'})
+        self.assertEqual(c.get_filecontent(plain_path, 'utf-8'), 'body { color: red; }')
+
+        # The rest are rendered with the context and cached
+        self.assertEqual(c.get_filecontent(template_path, 'utf-8'), 'var url = "/foo/";')
+        misses = template_cache.misses
+        c = SimpleCompressor(context={'STATIC_URL': '/foo/', 'object': object()})
+        self.assertEqual(c.get_filecontent(template_path, 'utf-8'), 'var url = "/foo/";')
+        self.assertEqual(template_cache.misses, misses)
+
+        # Different values get their own output
+        c = SimpleCompressor(context={'STATIC_URL': '/bar/'})
+        self.assertEqual(c.get_filecontent(template_path, 'utf-8'), 'var url = "/bar/";')
+
+        # Templates that use values we can't key on are rendered every time
+        class Page(object):
+            slug = 'baz'
+        with open(template_path, 'w') as f:
+            f.write('var slug = "{{ object.slug }}";')
+        c = SimpleCompressor(context={'object': Page()})
+        self.assertEqual(c.get_filecontent(template_path, 'utf-8'), 'var slug = "baz";')
+        Page.slug = 'qux'
+        self.assertEqual(c.get_filecontent(template_path, 'utf-8'), 'var slug = "qux";')
+
+        # Included templates are part of the key, so editing one gets new output
+        template_dir = tempfile.mkdtemp()
+        include_path = os.path.join(template_dir, 'include.js')
+        with open(include_path, 'w') as f:
+            f.write('var color = "red";')
+        with open(template_path, 'w') as f:
+            f.write('{% include "include.js" %}')
+        templates = [{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'DIRS': [template_dir],
+        }]
+        with override_settings(TEMPLATES=templates):
+            c = SimpleCompressor(context={})
+            self.assertEqual(c.get_filecontent(template_path, 'utf-8'), 'var color = "red";')
+            with open(include_path, 'w') as f:
+                f.write('var color = "blue";')
+            # Forget the loaded template, like the next build would
+            for loader in Engine.get_default().template_loaders:
+                loader.reset()
+            self.assertEqual(c.get_filecontent(template_path, 'utf-8'), 'var color = "blue";')
+
+    def test_compiled_cache(self):
+        """
+        Test precompiled and filtered code is cached on disk
+        """
+        def count_entries():
+            return sum(len(f) for d, s, f in os.walk(SimpleCompressor.compiled_cache.directory))
+
+        # Minified code is saved
+        c = SimpleJsCompressor(u'<script>var  a  =  1;</script>')
+        before = count_entries()
+        self.assertEqual(''.join(c.filter_input()), ';var  a  =  1;')
+        self.assertEqual(c.filter_output(u'var  a  =  1;'), 'var a=1;')
+        self.assertEqual(count_entries(), before + 2)
+
+        # And read back the next time around
+        c = SimpleJsCompressor(u'<script>var  a  =  1;</script>')
+        self.assertEqual(c.filter_output(u'var  a  =  1;'), 'var a=1;')
+        self.assertEqual(count_entries(), before + 2)
+
+        # Precompilers that ask to be cached are too
+        with override_settings(
+            COMPRESS_PRECOMPILERS=(('text/x-upper', 'tr a-z A-Z'),),
+            COMPRESS_CACHEABLE_PRECOMPILERS=('text/x-upper',),
+            COMPRESS_JS_FILTERS=[]
+        ):
+            html = u'<script type="text/x-upper">var b = 2;</script>'
+            self.assertEqual(''.join(SimpleJsCompressor(html).filter_input()), ';VAR B = 2;')
+            after = count_entries()
+            self.assertEqual(''.join(SimpleJsCompressor(html).filter_input()), ';VAR B = 2;')
+            self.assertEqual(count_entries(), after)
+
+            # Unless the cache is turned off
+            with override_settings(BIGBUILD_COMPRESS_CACHE=False):
+                html = u'<script type="text/x-upper">var c = 3;</script>'
+                self.assertEqual(''.join(SimpleJsCompressor(html).filter_input()), ';VAR C = 3;')
+                self.assertEqual(count_entries(), after)
+
+        # The ES6 compiler's key changes along with the files it can import
+        from django.conf import settings
+        installed_apps = list(settings.INSTALLED_APPS) + ['compressor_toolkit']
+        with override_settings(INSTALLED_APPS=installed_apps):
+            from bigbuild.precompilers import ES6Compiler
+            obj, other = PageList().dynamic_pages[:2]
+
+            def get_parts():
+                filename = os.path.join(obj.page_directory_path, 'index.html')
+                return ES6Compiler(u'', filename=filename).get_cache_key_parts()
+            parts = get_parts()
+            self.assertEqual(get_parts(), parts)
+
+            # Files that can't be imported, or belong to other pages, don't matter
+            with open(os.path.join(obj.page_directory_path, 'static', 'image.png'), 'wb') as f:
+                f.write(b'not really a png')
+            with open(os.path.join(other.page_directory_path, 'static', 'module.js'), 'w') as f:
+                f.write('module.exports = 2;')
+            self.assertEqual(get_parts(), parts)
+
+            # Modules in the page do
+            with open(os.path.join(obj.page_directory_path, 'static', 'module.js'), 'w') as f:
+                f.write('module.exports = 1;')
+            self.assertNotEqual(get_parts(), parts)
+
+    def test_compiler_pool(self):
+        """
+        Test compile jobs are spread across long-lived workers
+        """
+        stub_path = os.path.join(tempfile.mkdtemp(), 'compiler.py')
+        with open(stub_path, 'w') as f:
+            f.write(STUB_COMPILER)
+        command = [sys.executable, stub_path]
+
+        # Workers stick around between jobs, until they've done too many
+        pool = CompilerPool(command, size=1, max_jobs=3)
+        pids = []
+        for i in range(4):
+            pid, output = pool.compile(u'var a;').split(' ', 1)
+            self.assertEqual(output, 'VAR A;')
+            pids.append(pid)
+        self.assertEqual(len(set(pids[:3])), 1)
+        self.assertNotEqual(pids[2], pids[3])
+
+        # Compiler errors come back as exceptions and leave the worker running
+        with self.assertRaises(CompilerError):
+            pool.compile(u'error')
+        self.assertEqual(pool.compile(u'var b;').split(' ')[0], pids[3])
+
+        # Workers that die are replaced
+        with self.assertRaises(CompilerError):
+            pool.compile(u'crash')
+        self.assertTrue(pool.compile(u'var c;').endswith('VAR C;'))
+        pool.close()
+
+        # Jobs from many threads share the pool
+        pool = CompilerPool(command, size=2)
+        sources = [u'var x{};'.format(i) for i in range(10)]
+        outputs = ThreadPool(4).map(pool.compile, sources)
+        self.assertEqual([o.split(' ', 1)[1] for o in outputs], [s.upper() for s in sources])
+        self.assertEqual(len(set(o.split(' ')[0] for o in outputs)), 2)
+        pool.close()
+
+        # And the ES6 compiler can use one
+        from django.conf import settings
+        installed_apps = list(settings.INSTALLED_APPS) + ['compressor_toolkit']
+        with override_settings(
+            INSTALLED_APPS=installed_apps,
+            BIGBUILD_ES6_WORKERS=1,
+            BIGBUILD_ES6_WORKER_COMMAND=command
+        ):
+            from bigbuild.precompilers import ES6Compiler
+            self.assertTrue(ES6Compiler(u'let d = 4;').input().endswith('LET D = 4;'))
+
+            # Unless a custom compiler command has been set, which is run on its own
+            with override_settings(COMPRESS_ES6_COMPILER_CMD='cat {infile} > {outfile}'):
+                compiler = ES6Compiler(u'let d = 4;', command='cat {infile} > {outfile}')
+                self.assertEqual(compiler.input(), u'let d = 4;')
+
+    def test_es6_page_paths(self):
+        """
+        Test code compressed on a page is only compiled against that page's static directory
+        """
+        stub_path = os.path.join(tempfile.mkdtemp(), 'compiler.py')
+        with open(stub_path, 'w') as f:
+            f.write(STUB_COMPILER)
+        obj = PageList()[0]
+        static_dir = os.path.join(obj.page_directory_path, 'static')
+        with open(os.path.join(static_dir, 'paths.js'), 'w') as f:
+            f.write('paths')
+
+        from django.conf import settings
+        with override_settings(
+            INSTALLED_APPS=list(settings.INSTALLED_APPS) + ['compressor_toolkit'],
+            BIGBUILD_ES6_WORKERS=1,
+            BIGBUILD_ES6_WORKER_COMMAND=[sys.executable, stub_path],
+            BIGBUILD_COMPRESS_CACHE=False,
+            COMPRESS_JS_FILTERS=[]
+        ):
+            from django.apps import apps
+            node_modules = apps.get_app_config('compressor_toolkit').NODE_MODULES
+            context = {'object': obj, 'STATIC_URL': obj.get_static_url()}
+
+            # Files from the page's static directory
+            html = u'<script type="module" src="{}paths.js"></script>'.format(obj.get_static_url())
+            output = ''.join(SimpleJsCompressor(html, context=context).filter_input())
+            self.assertEqual(json.loads(output.lstrip(';')), [static_dir, node_modules])
+
+            # And code written into the page itself
+            html = u'<script type="module">paths</script>'
+            output = ''.join(SimpleJsCompressor(html, context=context).filter_input())
+            self.assertEqual(json.loads(output.lstrip(';')), [static_dir, node_modules])
@@ -1,7 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import os
 import logging
+import tempfile
 from bigbuild.tests import TestBase
+from bigbuild.models import PageList
+from django.template import Engine
+from django.test import RequestFactory, override_settings
+from bigbuild.rendering import PageProxy, TemplateCache, get_page_engine, get_request
 from bigbuild.views import PageListView, PageDetailView
 logging.disable(logging.CRITICAL)
 
@@ -13,3 +19,74 @@ class TestViews(TestBase):
     def test_views(self):
         PageListView.as_view()
         PageDetailView.as_view()
+
+    def test_template_cache(self):
+        cache = TemplateCache()
+        engine = Engine.get_default()
+
+        # Compiling the same source twice only does the work once
+        first = cache.from_string(engine, u"Hello {{ name }}")
+        self.assertTrue(cache.from_string(engine, u"Hello {{ name }}") is first)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # Files are keyed on their modification time, so edits come through
+        obj = PageList()[0]
+        path = os.path.join(obj.page_directory_path, "index.html")
+        template = cache.from_file(engine, path)
+        self.assertTrue(cache.from_file(engine, path) is template)
+        os.utime(path, (0, 0))
+        self.assertFalse(cache.from_file(engine, path) is template)
+
+        # And old templates are thrown out once there are too many
+        with override_settings(BIGBUILD_TEMPLATE_CACHE_SIZE=1):
+            cache.from_string(engine, u"Goodbye {{ name }}")
+            self.assertEqual(len(cache.engines[engine]), 1)
+
+    def test_page_detail_view(self):
+        obj = PageList()[0]
+        request = RequestFactory().get(obj.get_absolute_url())
+        response = PageDetailView.as_view()(request, slug=obj.slug)
+        response.render()
+        self.assertEqual(response.status_code, 200)
+
+    def test_page_engine(self):
+        # Rendering pages leaves the project's engine alone
+        dirs = list(Engine.get_default().dirs)
+        for obj in PageList():
+            obj.render_content(u"{{ object.slug }}")
+        self.assertEqual(Engine.get_default().dirs, dirs)
+
+        # And reuses the same page engine
+        engine = get_page_engine()
+        self.assertTrue(get_page_engine() is engine)
+        self.assertEqual(engine.dirs.count(engine.dirs[-1]), 1)
+
+        # Until the settings it's based on change
+        with override_settings(BIGBUILD_PAGE_DIR=tempfile.mkdtemp()):
+            self.assertFalse(get_page_engine() is engine)
+
+    def test_page_proxy(self):
+        obj = PageList()[0]
+        proxy = PageProxy(obj, data={'foo': 'bar'})
+
+        # It reads through to the page, except where something is swapped in
+        self.assertEqual(proxy.slug, obj.slug)
+        self.assertEqual(proxy.get_static_url(), obj.get_static_url())
+        self.assertEqual(proxy.data, {'foo': 'bar'})
+        self.assertEqual(str(proxy), str(obj))
+
+        # And it can't be changed
+        with self.assertRaises(AttributeError):
+            proxy.slug = 'foo'
+
+        # Rendering swaps the data in without touching the page
+        obj.data_objects = {'foo': 'bar'}
+        self.assertEqual(obj.render_content(u"{{ object.slug }} {{ object.data.foo }}"), u"{} bar".format(obj.slug))
+        self.assertFalse(obj.data == {'foo': 'bar'})
+
+    def test_get_request(self):
+        first = get_request('/foo/')
+        second = get_request('/bar/')
+        self.assertEqual(first.path, '/foo/')
+        self.assertEqual(second.get_full_path(), '/bar/')
+        self.assertEqual(second.META['PATH_INFO'], '/bar/')
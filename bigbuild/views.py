@@ -3,19 +3,26 @@
 import os
 import logging
 import bigbuild
+import traceback
 from fs import path
 from fs import copy
+from fs.errors import NoSysPath
 from django.urls import reverse
 from django.http import Http404
 from django.conf import settings
 from bigbuild.forms import PageForm
+from bigbuild.gzipper import Gzipper
+from bigbuild.exceptions import BuildError
+from bigbuild.sync import sync_directory
+from bigbuild.workers import map_in_pool
+from bigbuild.manifests import BuildManifest
 from django.views.static import serve
 from bigbuild import context_processors
 from django.utils.encoding import smart_text
 from django.views.generic.edit import UpdateView
+from bigbuild.rendering import BackendTemplate, PageProxy, get_page_engine, template_cache
 from bigbuild.models import PageList, Page, ArchivedPage
 from django.core.serializers.base import DeserializationError
-from bigbuild.management.commands.build import Command as Build
 from bakery.views import (
     BuildableTemplateView,
     BuildableDetailView,
@@ -71,7 +78,9 @@ class IndexRedirectView(BuildableRedirectView, BigBuildMixin):
     """
     Redirects the root URL to /projects/
     """
-    url = bigbuild.get_base_url()
+    @property
+    def url(self):
+        return bigbuild.get_base_url()
 
     @property
     def build_path(self):
@@ -95,7 +104,7 @@ class PageListView(BuildableTemplateView, BigBuildMixin):
             'working'
         )
         context = {
-            'object_list': [p for p in PageList() if p.show_in_feeds],
+            'object_list': [p for p in PageList.snapshot() if p.show_in_feeds],
             'BIGBUILD_PAGE_PUBLICATION_STATUS': PAGE_PUBLICATION_STATUS
         }
         return self.process_context(context)
@@ -105,22 +114,21 @@ class PageDetailView(BuildableDetailView, BigBuildMixin):
     """
     Renders one of the page objects as an HTML response.
     """
+    # Set to True by the build command's --incremental option
+    incremental = False
+    # Set by the build command's --workers option
+    workers = 1
+
     def get_object(self):
         """
         Returns the Page object being rendered by this view.
         """
-        # Check if it is a dynamic page, if so return it
-        try:
-            return PageList.get_page(self.kwargs.get("slug"), 'Page')
-        except DeserializationError:
-            pass
-        # Check if it is an archived page, if so return it
+        # Look for a dynamic or archived page with this slug
         try:
-            return PageList.get_page(self.kwargs.get("slug"), 'ArchivedPage')
-        except DeserializationError:
-            pass
-        # Otherwise, 404
-        raise Http404("No page found with the slug '{}'".format(self.kwargs.get("slug")))
+            return PageList.get_page_by_slug(self.kwargs.get("slug"))
+        except (KeyError, DeserializationError):
+            # Otherwise, 404
+            raise Http404("No page found with the slug '{}'".format(self.kwargs.get("slug")))
 
     def get_template_names(self):
         """
@@ -132,16 +140,32 @@ class PageDetailView(BuildableDetailView, BigBuildMixin):
             template_dir = self.object.archive_static_directory_path
         return [os.path.join(template_dir, "index.html")]
 
+    def render_to_response(self, context, **response_kwargs):
+        """
+        Returns a response rendered from the page's index.html, compiled through bigbuild's template cache.
+        """
+        template = template_cache.from_file(get_page_engine(), self.get_template_names()[0])
+        response_kwargs.setdefault('content_type', self.content_type)
+        return self.response_class(
+            request=self.request,
+            template=BackendTemplate(template),
+            context=context,
+            **response_kwargs
+        )
+
     def get_context_data(self, object=None):
         """
         Returns the context dictionary to use when rending this page.
         """
+        obj = self.object
         # If the object has data objects pulled from remote files,
-        # swap those in for the paths here.
-        if self.object.data_objects.keys():
-            self.object.data = self.object.data_objects
+        # swap those in for the paths here on a read-only proxy, since the object
+        # may be shared with other views via PageList.snapshot.
+        data_objects = obj.load_data_objects()
+        if data_objects.keys():
+            obj = PageProxy(obj, data=data_objects)
         context = {
-            'object': self.object,
+            'object': obj,
             'STATIC_URL': self.object.get_static_url()
         }
         return self.process_context(context)
@@ -159,18 +183,40 @@ class PageDetailView(BuildableDetailView, BigBuildMixin):
             obj.get_static_url().lstrip("/")
         )
 
-        # An internal django-bakery trick to gzip them if we need to
+        # Gzip them if we need to
         if settings.BAKERY_GZIP:
-            cmd = Build()
-            cmd.set_options()
-            cmd.copytree_and_gzip(
-                source_dir,
-                target_dir
-            )
+            self.get_gzipper().copytree_and_gzip(source_dir, target_dir)
         else:
             # Or a more vanilla way of copying the files with Python
+            self.copy_directory(source_dir, target_dir)
+
+    def get_gzipper(self):
+        """
+        Returns the Gzipper this view uses to copy static directories, shared across every page it builds.
+        """
+        if not hasattr(self, '_gzipper'):
+            self._gzipper = Gzipper(self.fs, processes=self.workers)
+        return self._gzipper
+
+    def copy_directory(self, source_dir, target_dir):
+        """
+        Copies the provided source directory on the local filesystem into the build filesystem.
+
+        If the build is on the local filesystem too, it is synced so that unchanged files are skipped.
+        """
+        try:
+            target_syspath = self.fs.getsyspath(smart_text(target_dir))
+        except NoSysPath:
             logger.debug("Copying {}{} to {}{}".format("osfs://", source_dir, self.fs_name, target_dir))
             copy.copy_dir("osfs:///", smart_text(source_dir), self.fs, smart_text(target_dir))
+        else:
+            logger.debug("Syncing {} to {}".format(source_dir, target_syspath))
+            sync_directory(
+                source_dir,
+                target_syspath,
+                use_hash=getattr(settings, 'BIGBUILD_SYNC_HASH', False),
+                hardlink=getattr(settings, 'BIGBUILD_SYNC_HARDLINKS', False)
+            )
 
     def build_object(self, obj):
         """
@@ -187,28 +233,68 @@ class PageDetailView(BuildableDetailView, BigBuildMixin):
             # ... do a copy and paste from the archive to the build directory
             target = obj.build_directory_path
             if settings.BAKERY_GZIP:
-                cmd = Build()
-                cmd.set_options()
-                cmd.copytree_and_gzip(
-                    obj.archive_static_directory_path,
-                    target
-                )
+                self.get_gzipper().copytree_and_gzip(obj.archive_static_directory_path, target)
             else:
-                logger.debug("Copying {}{} to {}{}".format(
-                    "osfs://",
-                    obj.archive_static_directory_path,
-                    self.fs_name,
-                    target
-                ))
-                copy.copy_dir(
-                    "osfs:///",
-                    smart_text(obj.archive_static_directory_path),
-                    self.fs,
-                    smart_text(target)
-                )
+                self.copy_directory(obj.archive_static_directory_path, target)
 
     def build_queryset(self):
-        [self.build_object(o) for o in PageList()]
+        """
+        Builds every page, skipping those that haven't changed since the last build when building incrementally.
+        """
+        manifest = BuildManifest(self.fs)
+        build_list = []
+        for obj in PageList.snapshot():
+            fingerprint = manifest.get_page_fingerprint(obj)
+            if self.incremental and manifest.is_current(obj, fingerprint):
+                logger.debug("Skipping {}, it hasn't changed since the last build".format(obj))
+            else:
+                build_list.append(obj)
+            manifest.add(obj, fingerprint)
+
+        # Build them one by one, or spread them across a pool of processes
+        if self.workers > 1:
+            self.build_pooled(build_list)
+        else:
+            [self.build_object(o) for o in build_list]
+            if hasattr(self, '_gzipper'):
+                logger.info("Gzipped {} static files, saving {} bytes".format(
+                    self._gzipper.file_count,
+                    self._gzipper.bytes_saved
+                ))
+
+        # Clear out any pages that have been removed since the last build
+        manifest.prune()
+        manifest.write()
+
+    def build_pooled(self, object_list):
+        """
+        Builds the provided objects across a pool of worker processes.
+
+        Raises a BuildError listing every page that failed once they have all been attempted.
+        """
+        results = map_in_pool(
+            build_page,
+            [(self.__class__, o, self.workers) for o in object_list],
+            workers=self.workers
+        )
+        failures = [r for r in results if r]
+        if failures:
+            raise BuildError(failures)
+
+
+def build_page(args):
+    """
+    Builds the provided object with a new instance of the provided view class,
+    told how many workers are building alongside it.
+
+    Accepts a single tuple so it can be mapped across PageDetailView's worker pool.
+    Returns None if the build worked, or the slug and error message if it failed.
+    """
+    view_class, obj, workers = args
+    try:
+        view_class(workers=workers).build_object(obj)
+    except Exception:
+        return (obj.slug, traceback.format_exc())
 
 
 class PageArchiveView(PageDetailView):
@@ -226,12 +312,13 @@ class PageUpdateView(UpdateView):
     template_name_suffix = '_update_form'
 
     def get_queryset(self):
-        return PageList()
+        return PageList.snapshot()
 
     def get_object(self, queryset=None):
-        if queryset is None:
-            queryset = self.get_queryset()
         slug = self.kwargs.get(self.slug_url_kwarg)
+        if queryset is None:
+            # Load only the requested page rather than the whole list
+            return PageList.get_page_by_slug(slug)
         return queryset[slug]
 
 
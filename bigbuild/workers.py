@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Utilities for spreading work across a pool of processes.
+"""
+import os
+import six
+import json
+import atexit
+import django
+import logging
+import itertools
+import threading
+import subprocess
+import multiprocessing
+from six.moves import queue
+from bigbuild.exceptions import CompilerError
+logger = logging.getLogger(__name__)
+
+
+def init_worker():
+    """
+    Sets up Django inside a newly started worker process.
+    """
+    django.setup()
+
+
+def map_in_pool(func, items, workers=1):
+    """
+    Returns the result of calling func on every item, spread across the provided number of worker processes.
+
+    Results are returned in the same order as the items. With one worker, or one item, no pool is started.
+
+    The function must be importable at the module level so it can be sent to the workers.
+    """
+    items = list(items)
+    workers = min(int(workers or 1), len(items))
+    if workers <= 1:
+        return [func(i) for i in items]
+
+    logger.debug("Pooling {} items across {} processes".format(len(items), workers))
+    pool = multiprocessing.Pool(processes=workers, initializer=init_worker)
+    try:
+        results = pool.map(func, items)
+    except Exception:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+    return results
+
+
+class CompilerWorkerError(Exception):
+    """
+    Raised when a compiler worker process dies, hangs or breaks the protocol.
+    """
+    pass
+
+
+class CompilerWorker(object):
+    """
+    A long-lived compiler process that takes jobs one at a time over a JSON lines protocol.
+
+    Each job is written to the process's stdin as a single line of JSON with an id, the source code and a dictionary
+    of options. The process answers on stdout with a line of JSON holding the same id and either the compiled output
+    or an error message:
+
+        {"id": 1, "source": "...", "options": {...}}
+        {"id": 1, "output": "..."}
+        {"id": 1, "error": "..."}
+
+    Anything written to stderr goes straight through to ours.
+    """
+    def __init__(self, command):
+        self.command = command
+        self.jobs = 0
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        # Read responses on a separate thread so we can stop waiting on a hung process
+        self.lines = queue.Queue()
+        self.reader = threading.Thread(target=self.read_lines)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def read_lines(self):
+        """
+        Passes each line the process writes to stdout to the lines queue, followed by None once it closes.
+        """
+        for line in iter(self.process.stdout.readline, b''):
+            self.lines.put(line)
+        self.lines.put(None)
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, job_id, source, options, timeout=None):
+        """
+        Sends the provided job to the process and returns its response as a dictionary.
+
+        Raises a CompilerWorkerError if the process can't be reached, doesn't answer in time or gives a bad answer.
+        """
+        line = json.dumps({"id": job_id, "source": source, "options": options}) + "\n"
+        try:
+            self.process.stdin.write(line.encode("utf-8"))
+            self.process.stdin.flush()
+        except (IOError, OSError) as e:
+            raise CompilerWorkerError("Could not send job to {}: {}".format(self, e))
+
+        try:
+            response = self.lines.get(timeout=timeout)
+        except queue.Empty:
+            raise CompilerWorkerError("{} did not answer within {} seconds".format(self, timeout))
+        if response is None:
+            raise CompilerWorkerError("{} exited with code {}".format(self, self.process.wait()))
+
+        try:
+            result = json.loads(response.decode("utf-8"))
+        except ValueError:
+            raise CompilerWorkerError("{} gave an invalid response: {!r}".format(self, response))
+        if not isinstance(result, dict) or result.get("id") != job_id:
+            raise CompilerWorkerError("{} answered the wrong job: {!r}".format(self, response))
+        self.jobs += 1
+        return result
+
+    def stop(self):
+        """
+        Shuts the process down by closing its stdin, terminating it if it's still running.
+        """
+        try:
+            self.process.stdin.close()
+        except (IOError, OSError):
+            pass
+        if self.alive:
+            self.process.terminate()
+        self.process.wait()
+        self.process.stdout.close()
+
+    def __str__(self):
+        return "Compiler worker {}".format(self.process.pid)
+
+
+class CompilerPool(object):
+    """
+    A pool of CompilerWorker processes that jobs can be sent to from any number of threads.
+
+    Each job goes to the next free worker. Workers are started as they're needed, up to the provided size.
+    Any that fail are thrown out and the job is retried on a new one. Workers are also replaced once they've
+    finished max_jobs jobs, so a slow leak in the compiler can't pile up over a build.
+    """
+    def __init__(self, command, size=1, max_jobs=100, timeout=120, retries=1):
+        self.command = list(command)
+        self.size = size
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.retries = retries
+        self.job_ids = itertools.count(1)
+        self.workers = set()
+        self.lock = threading.Lock()
+        # Free workers wait here. None stands in for a slot that doesn't have a worker started yet.
+        self.idle = queue.Queue()
+        for i in range(size):
+            self.idle.put(None)
+
+    def get_worker(self):
+        """
+        Returns the next free worker, waiting for one if they're all busy.
+        """
+        worker = self.idle.get()
+        if worker is None:
+            try:
+                worker = CompilerWorker(self.command)
+            except (IOError, OSError) as e:
+                # Give the slot back so the pool doesn't shrink
+                self.idle.put(None)
+                raise CompilerError("Could not start compiler {}: {}".format(" ".join(self.command), e))
+            logger.debug("Started {}".format(worker))
+            with self.lock:
+                self.workers.add(worker)
+        return worker
+
+    def release(self, worker, failed=False):
+        """
+        Returns the provided worker to the pool, or replaces it if it failed or has done enough jobs.
+        """
+        if not failed and worker.alive and worker.jobs < self.max_jobs:
+            self.idle.put(worker)
+            return
+        self.stop_worker(worker)
+        self.idle.put(None)
+
+    def stop_worker(self, worker):
+        """
+        Shuts down the provided worker and drops it from the pool.
+        """
+        logger.debug("Stopping {} after {} jobs".format(worker, worker.jobs))
+        with self.lock:
+            self.workers.discard(worker)
+        worker.stop()
+
+    def compile(self, source, **options):
+        """
+        Returns the provided source code compiled by one of the workers, with the provided options.
+
+        Raises a CompilerError if the compiler reports an error, or the job fails on every worker it's tried on.
+        """
+        for attempt in range(self.retries + 1):
+            worker = self.get_worker()
+            try:
+                result = worker.run(next(self.job_ids), source, options, timeout=self.timeout)
+            except CompilerWorkerError as e:
+                logger.warning("{}, restarting it".format(e))
+                self.release(worker, failed=True)
+                error = e
+                continue
+            self.release(worker)
+            if "error" in result:
+                raise CompilerError(result["error"])
+            return result.get("output", "")
+        raise CompilerError(six.text_type(error))
+
+    def close(self):
+        """
+        Stops every worker in the pool.
+        """
+        with self.lock:
+            workers = list(self.workers)
+        for worker in workers:
+            self.stop_worker(worker)
+
+
+# The pools started in this process, keyed by process id and configuration
+_compiler_pools = {}
+_compiler_pools_lock = threading.Lock()
+
+
+def get_compiler_pool(command, size=1, max_jobs=100, timeout=120):
+    """
+    Returns the pool of compilers running the provided command with the provided configuration,
+    starting one if it doesn't exist yet.
+
+    Pools are shared by everything in a process and shut down when it exits.
+    Processes forked from this one get pools of their own.
+    """
+    key = (os.getpid(), tuple(command), size, max_jobs, timeout)
+    with _compiler_pools_lock:
+        try:
+            return _compiler_pools[key]
+        except KeyError:
+            pool = _compiler_pools[key] = CompilerPool(command, size=size, max_jobs=max_jobs, timeout=timeout)
+            return pool
+
+
+@atexit.register
+def close_compiler_pools():
+    """
+    Stops the compiler pools started in this process.
+    """
+    for key, pool in list(_compiler_pools.items()):
+        if key[0] == os.getpid():
+            pool.close()